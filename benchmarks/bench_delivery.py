@@ -0,0 +1,105 @@
+"""Пропускная способность очереди доставки на фейковом Bot.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_delivery --messages 50000 --chats 20000
+
+Лимиты Telegram по умолчанию (30 сообщений/с) сделают прогон долгим,
+поэтому для оценки накладных расходов самой очереди их можно поднять:
+    python -m benchmarks.bench_delivery --global-rate 100000 --chat-interval 0
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from delivery import DeliveryQueue
+
+class FakeBot:
+    """Заменитель Bot: имитирует задержку API и редкие RetryAfter"""
+
+    def __init__(self, latency, retry_after_rate):
+        self.latency = latency
+        self.retry_after_rate = retry_after_rate
+        self.calls = 0
+        self.retries = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if random.random() < self.retry_after_rate:
+            self.retries += 1
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), "Flood control", 1)
+
+class FakeDatabase:
+    """outbox в памяти"""
+
+    def __init__(self, rows):
+        self.pending = list(reversed(rows))
+        self.claims = 0
+        self.batches = 0
+        self.marked = 0
+
+    async def acquire_lease(self, name, owner, ttl):
+        return True
+
+    async def release_lease(self, name, owner):
+        pass
+
+    async def release_outbox(self, owner):
+        return 0
+
+    async def count_outbox(self, state='pending'):
+        return len(self.pending)
+
+    async def claim_outbox(self, limit, owner, timeout=600):
+        self.claims += 1
+        batch = self.pending[-limit:][::-1]
+        del self.pending[-limit:]
+        return batch
+
+    async def complete_outbox(self, sent_ids, failed_ids=()):
+        self.batches += 1
+        self.marked += len(sent_ids) + len(failed_ids)
+
+async def run(args):
+    bot = FakeBot(args.latency, args.retry_after_rate)
+    db = FakeDatabase([(i, i % args.chats, f"⏰ Напоминание {i}", None) for i in range(args.messages)])
+    queue = DeliveryQueue(
+        bot, db,
+        workers=args.workers,
+        global_rate=args.global_rate,
+        chat_interval=args.chat_interval,
+    )
+    started = time.perf_counter()
+    await queue.start()
+    while db.pending or db.marked < args.messages:
+        await asyncio.sleep(0.01)
+    await queue.join()
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+
+    print(f"сообщений:        {args.messages} в {args.chats} чатов")
+    print(f"время разгрузки:  {elapsed:.2f} с")
+    print(f"уведомлений/с:    {db.marked / elapsed:.0f}")
+    print(f"сообщений/с:      {queue.sent / elapsed:.0f}")
+    print(f"вызовов API:      {bot.calls} (RetryAfter: {bot.retries})")
+    print(f"доставлено/сбоев: {queue.sent}/{queue.failed} сообщений")
+    print(f"выборок outbox:   {db.claims}")
+    print(f"записей в БД:     {db.marked} за {db.batches} транзакций")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--chats", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--global-rate", type=float, default=30)
+    parser.add_argument("--chat-interval", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--retry-after-rate", type=float, default=0.0)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Сценарии нагрузки на настоящие хендлеры через Dispatcher и фейковый Bot API.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_handlers --users 500 --history 5000 --output before.json
+    python -m benchmarks.bench_handlers --compare before.json
+
+Каждый сценарий печатает пропускную способность, p50/p99 задержки и время
+в SQLite (сумма bot_db_query_seconds вместе с ожиданием потока, поэтому при
+параллельной нагрузке оно больше общего); итог сохраняется в JSON, чтобы
+сравнивать прогоны между коммитами.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from aiogram import Dispatcher
+
+from benchmarks.fake_session import create_fake_bot
+from callbacks import TaskCallback, TasksPageCallback
+from database import Database
+from delivery import DeliveryQueue
+from fsm_storage import SQLiteStorage
+from handlers import get_handlers_router
+from metrics import DB_QUERY_SECONDS
+from recurrence import utc_now
+from scheduler import ReminderScheduler
+
+_update_ids = itertools.count(1)
+
+def _user(chat_id):
+    return {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+
+def message_update(chat_id, text):
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": _user(chat_id),
+            "text": text,
+        },
+    }
+
+def callback_update(chat_id, data):
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(chat_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": "📋 Ваши задачи",
+                "reply_markup": {"inline_keyboard": [[{"text": "✅", "callback_data": data}]]},
+            },
+        },
+    }
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+class Bench:
+    def __init__(self, db, bot, dp, concurrency):
+        self.db = db
+        self.bot = bot
+        self.dp = dp
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def feed(self, update, latencies):
+        async with self.semaphore:
+            started = time.perf_counter()
+            await self.dp.feed_raw_update(self.bot, update)
+            latencies.append(time.perf_counter() - started)
+
+    async def measure(self, name, scenario):
+        """Прогоняет сценарий: scenario(latencies) заполняет задержки отдельных операций"""
+        latencies = []
+        queries, db_time = DB_QUERY_SECONDS.totals()
+        api_calls = self.bot.session.total()
+        started = time.perf_counter()
+        await scenario(latencies)
+        elapsed = time.perf_counter() - started
+        queries_after, db_time_after = DB_QUERY_SECONDS.totals()
+
+        latencies.sort()
+        result = {
+            "operations": len(latencies),
+            "seconds": round(elapsed, 4),
+            "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "db_queries": queries_after - queries,
+            "db_seconds": round(db_time_after - db_time, 4),
+            "api_calls": self.bot.session.total() - api_calls,
+        }
+        print(f"{name:<16} {result['operations']:>7} оп  {result['throughput']:>9.1f} оп/с  "
+              f"p50 {result['p50_ms']:>8.2f} мс  p99 {result['p99_ms']:>8.2f} мс  "
+              f"SQLite {result['db_seconds']:.2f} с / {result['db_queries']} запросов")
+        return result
+
+async def add_tasks(bench, users, tasks_per_user):
+    async def scenario(latencies):
+        async def user(chat_id):
+            await bench.feed(message_update(chat_id, "/start"), latencies)
+            for i in range(tasks_per_user):
+                await bench.feed(message_update(chat_id, "/add"), latencies)
+                await bench.feed(message_update(chat_id, f"Задача {i} пользователя {chat_id}"), latencies)
+        await asyncio.gather(*(user(chat_id) for chat_id in range(1, users + 1)))
+    return await bench.measure("add_tasks", scenario)
+
+async def list_views(bench, chat_id, history, views):
+    await bench.db.add_user(chat_id, "heavy", "heavy")
+    for start in range(0, history, 1000):
+        await bench.db.add_tasks(chat_id, [f"Старая задача {i}" for i in range(start, min(history, start + 1000))])
+    # Курсор каждой страницы - последняя задача предыдущей
+    rows = await bench.db._read(lambda conn: conn.execute(
+        'SELECT created_at, id FROM tasks WHERE chat_id = ? AND is_done = FALSE ORDER BY created_at DESC, id DESC',
+        (chat_id,)
+    ).fetchall())
+    cursors = rows[9:-1:10] or [rows[-1]]
+
+    async def scenario(latencies):
+        updates = [message_update(chat_id, "📋 Мои задачи") if i % 2 == 0
+                   else callback_update(chat_id, TasksPageCallback.for_cursor(
+                       i % len(cursors) + 1, "n", cursors[i % len(cursors)]).pack()) for i in range(views)]
+        await asyncio.gather(*(bench.feed(update, latencies) for update in updates))
+    return await bench.measure("list_views", scenario)
+
+async def complete_tasks(bench, users, per_user):
+    targets = []
+    for chat_id in range(1, users + 1):
+        tasks = await bench.db.get_tasks(chat_id, limit=per_user)
+        targets.extend((chat_id, task_id) for task_id, _, _ in tasks)
+
+    async def scenario(latencies):
+        await asyncio.gather(*(
+            bench.feed(callback_update(chat_id, TaskCallback(action="d", id=task_id).pack()), latencies)
+            for chat_id, task_id in targets
+        ))
+    return await bench.measure("complete", scenario)
+
+async def scheduler_burst(bench, reminders):
+    """reminders напоминаний на одну минуту: от тика до отправки последнего"""
+    fire_at = utc_now() + timedelta(seconds=1)
+
+    def query(conn):
+        conn.executemany(
+            'INSERT OR IGNORE INTO users (chat_id, username, first_name) VALUES (?, ?, ?)',
+            [(100000 + i, "burst", "burst") for i in range(reminders)]
+        )
+        conn.executemany(
+            "INSERT INTO reminders (chat_id, name, time, reminder_datetime) VALUES (?, ?, ?, ?)",
+            [(100000 + i, f"Напоминание {i}", fire_at.strftime("%H:%M"), fire_at) for i in range(reminders)]
+        )
+        conn.commit()
+    await bench.db._write(query)
+
+    delivery = DeliveryQueue(bench.bot, bench.db, workers=64, global_rate=1_000_000, chat_interval=0)
+    scheduler = ReminderScheduler(bench.db, delivery)
+    sent_before = len(bench.bot.session.sent_at)
+
+    async def scenario(latencies):
+        await delivery.start()
+        task = asyncio.create_task(scheduler.run())
+        try:
+            while len(bench.bot.session.sent_at) - sent_before < reminders:
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await delivery.stop()
+        due = fire_at.replace(tzinfo=timezone.utc).timestamp()
+        # Задержка - от срока напоминания до вызова sendMessage
+        offset = time.time() - time.perf_counter()
+        latencies.extend(max(0.0, sent + offset - due) for _, sent in bench.bot.session.sent_at[sent_before:])
+    await asyncio.sleep(max(0.0, (fire_at - utc_now()).total_seconds()))
+    return await bench.measure("scheduler_burst", scenario)
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline):
+    print(f"\nсравнение с {baseline.get('revision') or 'базой'}:")
+    for name, result in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        changes = []
+        for key in ("throughput", "p50_ms", "p99_ms", "db_seconds"):
+            if old[key]:
+                changes.append(f"{key} {(result[key] / old[key] - 1) * 100:+.1f}%")
+        print(f"{name:<16} " + ", ".join(changes))
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        await db.init_db()
+        bot = create_fake_bot(args.api_latency)
+        dp = Dispatcher(storage=SQLiteStorage(db), db=db)
+        dp.include_router(get_handlers_router())
+        bench = Bench(db, bot, dp, args.concurrency)
+
+        scenarios = {}
+        try:
+            scenarios["add_tasks"] = await add_tasks(bench, args.users, args.tasks_per_user)
+            scenarios["list_views"] = await list_views(bench, 10**9, args.history, args.views)
+            scenarios["complete"] = await complete_tasks(bench, args.users, args.tasks_per_user)
+            scenarios["scheduler_burst"] = await scheduler_burst(bench, args.burst)
+        finally:
+            await db.close()
+
+    return {
+        "revision": git_revision(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": vars(args),
+        "scenarios": scenarios,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--tasks-per-user", type=int, default=5)
+    parser.add_argument("--history", type=int, default=5000)
+    parser.add_argument("--views", type=int, default=500)
+    parser.add_argument("--burst", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nрезультаты сохранены в {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
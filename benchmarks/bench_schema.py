@@ -0,0 +1,99 @@
+"""Стоимость запросов одного тика планировщика в зависимости от объёма таблиц.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_schema --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from migrations import migrate
+from recurrence import DAYS, next_fire
+
+QUERIES = {
+    "due_reminders": (
+        'SELECT id, chat_id, name, time, is_sent FROM reminders WHERE is_sent = FALSE AND reminder_datetime <= ?',
+        lambda now: (now,),
+    ),
+    "due_schedule": (
+        'SELECT id, user_id, day, time, text FROM schedule WHERE next_fire_at <= ?',
+        lambda now: (now,),
+    ),
+    "user_tasks": (
+        'SELECT id, text, is_done FROM tasks WHERE chat_id = ? AND is_done = FALSE ORDER BY created_at DESC',
+        lambda now: (42,),
+    ),
+}
+
+def populate(conn, rows, users=1000):
+    now = datetime.now().replace(second=0, microsecond=0)
+    rnd = random.Random(rows)
+
+    def reminders():
+        for i in range(rows):
+            # Почти все напоминания уже отправлены, как в живой базе,
+            # а неотправленные ждут своего времени
+            is_sent = i % 100 != 0
+            if is_sent:
+                dt = now - timedelta(minutes=rnd.randint(1, 60 * 24 * 30))
+            else:
+                dt = now + timedelta(minutes=rnd.randint(1, 60 * 24))
+            yield i % users, f"reminder {i}", dt.strftime("%H:%M"), dt, is_sent
+
+    def schedule():
+        for i in range(rows):
+            day, time_str = rnd.choice(DAYS), f"{rnd.randrange(24):02d}:{rnd.randrange(60):02d}"
+            yield i % users, day, time_str, f"item {i}", next_fire(f"weekly:{day}", time_str, now)
+
+    def tasks():
+        for i in range(rows):
+            yield i % users, f"task {i}", i % 3 == 0
+
+    conn.executemany('INSERT INTO reminders (chat_id, name, time, reminder_datetime, is_sent) VALUES (?, ?, ?, ?, ?)', reminders())
+    conn.executemany('INSERT INTO schedule (user_id, day, time, text, next_fire_at) VALUES (?, ?, ?, ?, ?)', schedule())
+    conn.executemany('INSERT INTO tasks (chat_id, text, is_done) VALUES (?, ?, ?)', tasks())
+    conn.commit()
+
+def measure(conn, repeat):
+    now = datetime.now()
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        args = params(now)
+        conn.execute(sql, args).fetchall()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, args).fetchall()
+        results[name] = (time.perf_counter() - started) / repeat * 1000
+    return results
+
+def explain(conn):
+    now = datetime.now()
+    for name, (sql, params) in QUERIES.items():
+        plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params(now)).fetchall()
+        print(f"  {name}: " + "; ".join(row[-1] for row in plan))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} " + " ".join(f"{name:>18}" for name in QUERIES) + "   (мс на запрос)")
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, "bench.db"))
+            migrate(conn)
+            populate(conn, rows)
+            conn.execute('ANALYZE')
+            results = measure(conn, args.repeat)
+            print(f"{rows:>10} " + " ".join(f"{results[name]:>18.4f}" for name in QUERIES))
+            if rows == args.sizes[-1]:
+                explain(conn)
+            conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Нагрузочный тест вебхука: синтетические Update JSON без сети.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_webhook --updates 5000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+from aiogram import Dispatcher
+
+from benchmarks.fake_session import create_fake_bot
+from database import Database
+from fsm_storage import SQLiteStorage
+from handlers import get_handlers_router
+from webhook import create_webhook_app
+
+SECRET = "bench-secret"
+TEXTS = ["📋 Мои задачи", "/start", "/add"]
+
+def make_update(update_id, chat_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "text": text,
+        },
+    }
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        await db.init_db()
+        bot = create_fake_bot(args.api_latency)
+        dp = Dispatcher(storage=SQLiteStorage(db), db=db)
+        dp.include_router(get_handlers_router())
+
+        server = TestServer(create_webhook_app(dp, bot, SECRET))
+        await server.start_server()
+        url = str(server.make_url("/webhook"))
+
+        latencies = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def post(session, i):
+            update = make_update(i + 1, i % args.chats + 1, TEXTS[i % len(TEXTS)])
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+                    await response.read()
+                    assert response.status == 200, response.status
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        async with ClientSession() as session:
+            await asyncio.gather(*(post(session, i) for i in range(args.updates)))
+            accepted = time.perf_counter() - started
+            # Ответ 200 приходит до обработки: ждём, пока каждый апдейт дойдёт до Bot API
+            while bot.session.total() < args.updates:
+                await asyncio.sleep(0.01)
+            processed = time.perf_counter() - started
+
+            async with session.post(url, json=make_update(0, 1, "/start")) as response:
+                rejected = response.status
+
+        await server.close()
+        await db.close()
+
+    latencies.sort()
+    print(f"апдейтов:            {args.updates} от {args.chats} чатов, параллельно {args.concurrency}")
+    print(f"приём (HTTP 200):    {args.updates / accepted:.0f} апдейтов/с")
+    print(f"обработка целиком:   {args.updates / processed:.0f} апдейтов/с")
+    print(f"задержка ответа:     p50 {statistics.median(latencies) * 1000:.1f} мс, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} мс")
+    print(f"без секрета:         HTTP {rejected}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Фейковая сессия Bot API: отвечает на запросы локально, без сети."""
+import asyncio
+import time
+import typing
+from collections import Counter
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message
+
+FAKE_TOKEN = "42:FAKE-TOKEN-FOR-BENCHMARKS"
+
+class FakeSession(BaseSession):
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests = Counter()
+        self.api_time = 0.0
+        # Моменты отправки сообщений: (chat_id, perf_counter)
+        self.sent_at = []
+        self._message_id = 0
+
+    async def close(self):
+        pass
+
+    async def make_request(self, bot, method, timeout=None):
+        started = time.perf_counter()
+        self.requests[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.api_time += time.perf_counter() - started
+        if type(method).__name__ == "SendMessage":
+            self.sent_at.append((method.chat_id, time.perf_counter()))
+
+        returning = method.__returning__
+        if returning is Message or Message in typing.get_args(returning):
+            self._message_id += 1
+            chat_id = getattr(method, "chat_id", None) or 0
+            return Message(
+                message_id=self._message_id,
+                date=datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                text=getattr(method, "text", None),
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    def total(self):
+        return sum(self.requests.values())
+
+def create_fake_bot(latency=0.0):
+    return Bot(token=FAKE_TOKEN, session=FakeSession(latency))
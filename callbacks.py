@@ -0,0 +1,54 @@
+import re
+
+from aiogram.filters.callback_data import CallbackData
+
+# Версия входит в префикс: при смене полей заводится новый префикс,
+# а хендлеры старого продолжают обслуживать уже отправленные кнопки.
+# Действия кодируются одной буквой, чтобы уложиться в 64 байта.
+
+class TaskCallback(CallbackData, prefix="t2"):
+    action: str  # d - выполнить
+    id: int
+
+class TaskCallbackV1(CallbackData, prefix="t1"):
+    action: str
+    id: int
+    page: int = 0
+
+class TasksPageCallback(CallbackData, prefix="tp2"):
+    page: int  # номер только для подписи, страницу задаёт курсор
+    direction: str  # n - задачи старше курсора, p - новее
+    at: str  # created_at задачи-курсора без разделителей: 20261018083412
+    id: int
+
+    @classmethod
+    def for_cursor(cls, page, direction, cursor):
+        created_at, task_id = cursor
+        return cls(page=page, direction=direction, at=re.sub(r"\D", "", str(created_at)), id=task_id)
+
+    @property
+    def cursor(self):
+        at = self.at
+        created_at = f"{at[:4]}-{at[4:6]}-{at[6:8]} {at[8:10]}:{at[10:12]}:{at[12:14]}"
+        if len(at) > 14:
+            created_at += f".{at[14:]}"
+        return self.direction, created_at, self.id
+
+class TasksPageCallbackV1(CallbackData, prefix="tp1"):
+    page: int
+
+class TasksBulkCallback(CallbackData, prefix="tb2"):
+    action: str  # a - выполнить все, x - удалить выполненные
+
+class TasksBulkCallbackV1(CallbackData, prefix="tb1"):
+    action: str
+    page: int = 0
+
+class NoopCallback(CallbackData, prefix="n1"):
+    pass
+
+class ScheduleDayCallback(CallbackData, prefix="sd1"):
+    day: str
+
+class SearchPageCallback(CallbackData, prefix="f1"):
+    page: int
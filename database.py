@@ -1,155 +1,890 @@
+import asyncio
+import json
+import re
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from cache import TTLCache
+from export import write_csv, write_json
+from metrics import DB_QUERY_SECONDS, LIST_CACHE_REQUESTS
+from migrations import migrate
+from recurrence import is_valid_rule, next_fire, user_zone, utc_now
+
+# Окончания, которые отбрасываются перед префиксным поиском: грубая замена
+# стемминга, которого нет в SQLite (молоко/молока/молоку -> молок*)
+SEARCH_ENDINGS = sorted((
+    "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими",
+    "ой", "ей", "ом", "ем", "ам", "ям", "ах", "ях", "ов", "ев", "ый", "ий", "ая", "яя", "ое", "ее", "ые", "ие", "ую", "юю",
+    "а", "я", "о", "е", "у", "ю", "ы", "и", "ь",
+), key=len, reverse=True)
+
+def search_stem(word):
+    for ending in SEARCH_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
 
 class Database:
-    def __init__(self, db_path="todo_bot.db"):
+    """Асинхронное хранилище: один поток-писатель и пул читателей в режиме WAL"""
+
+    def __init__(self, db_path="todo_bot.db", readers=4, list_cache_size=10000, list_cache_ttl=300):
         self.db_path = db_path
-        self.init_db()
-    
-    def init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    chat_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tasks (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id INTEGER,
-                    text TEXT NOT NULL,
-                    is_done BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (chat_id) REFERENCES users (chat_id)
-                )
-            ''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id INTEGER,
-                    name TEXT NOT NULL,
-                    time TEXT NOT NULL,
-                    reminder_datetime TIMESTAMP,
-                    is_sent BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (chat_id) REFERENCES users (chat_id)
-                )
-            ''')
-            conn.commit()
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS schedule (
-                    user_id INTEGER,
-                    day TEXT,
-                    time TEXT,
-                    text TEXT
-                )
-            """)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._listeners = []
+        self.list_cache = TTLCache(maxsize=list_cache_size, ttl=list_cache_ttl)
+        # В list_cache лежат все страницы чата сразу, поэтому попадания
+        # считаются по страницам здесь, а не счётчиками самого кэша
+        self.list_cache_hits = 0
+        self.list_cache_misses = 0
+        LIST_CACHE_REQUESTS.labels("hit").set_function(lambda: self.list_cache_hits)
+        LIST_CACHE_REQUESTS.labels("miss").set_function(lambda: self.list_cache_misses)
+        # Чаты, которые точно есть в users: повторный /start не идёт в писателя
+        self.known_users = TTLCache(maxsize=100000, ttl=24 * 3600)
+        self._list_generation = 0
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _run(self, query):
+        return query(self._connect())
+
+    async def _execute(self, executor, mode, query):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, self._run, query)
+        finally:
+            # Database.add_task.<locals>.query -> add_task
+            parts = query.__qualname__.split(".")
+            method = parts[-3] if len(parts) >= 3 else parts[0]
+            DB_QUERY_SECONDS.labels(method, mode).observe(time.perf_counter() - started)
+
+    async def _read(self, query):
+        return await self._execute(self._readers, "read", query)
+
+    async def _write(self, query):
+        return await self._execute(self._writer, "write", query)
+
+    def subscribe(self, callback):
+        """Регистрирует callback(event, payload), вызываемый после изменения напоминаний или расписания"""
+        self._listeners.append(callback)
+
+    def _notify(self, event, payload=None):
+        for callback in self._listeners:
+            callback(event, payload)
+
+    def _invalidate(self, chat_id):
+        self._list_generation += 1
+        self.list_cache.pop(chat_id)
+
+    async def data_version(self):
+        """Меняется, когда базу изменило другое соединение, в том числе из другого процесса"""
+        def query(conn):
+            return conn.execute('PRAGMA data_version').fetchone()[0]
+        return await self._write(query)
+
+    async def acquire_lease(self, name, owner, ttl):
+        """Берёт или продлевает аренду; True, если она принадлежит owner"""
+        now = time.time()
+
+        def query(conn):
+            conn.execute('''
+                INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+            ''', (name, owner, now + ttl, now))
+            conn.commit()
+            return conn.execute('SELECT owner FROM leases WHERE name = ?', (name,)).fetchone()[0] == owner
+        return await self._write(query)
+
+    async def release_lease(self, name, owner):
+        def query(conn):
+            conn.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
             conn.commit()
-    def add_user(self, chat_id, username, first_name):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        await self._write(query)
+
+    async def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    async def init_db(self):
+        def query(conn):
+            version = migrate(conn)
+            # auto_vacuum переключается только полным VACUUM: один раз на старой базе
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+            return version
+        return await self._write(query)
+
+    async def add_user(self, chat_id, username, first_name):
+        if self.known_users.get(chat_id):
+            return
+
+        def query(conn):
+            conn.execute('''
                 INSERT OR IGNORE INTO users (chat_id, username, first_name)
                 VALUES (?, ?, ?)
             ''', (chat_id, username, first_name))
             conn.commit()
-    
-    def add_task(self, chat_id, text):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO tasks (chat_id, text) VALUES (?, ?)', (chat_id, text))
+        await self._write(query)
+        self.known_users.set(chat_id, True)
+
+    @staticmethod
+    def _user_tz(conn, chat_id):
+        row = conn.execute('SELECT tz FROM users WHERE chat_id = ?', (chat_id,)).fetchone()
+        return row[0] if row else None
+
+    async def get_user_timezone(self, chat_id):
+        return await self._read(lambda conn: self._user_tz(conn, chat_id))
+
+    async def set_user_timezone(self, chat_id, tz_name):
+        """Сохраняет зону пользователя и пересчитывает в UTC его ближайшие срабатывания"""
+        now = utc_now()
+        zone = user_zone(tz_name)
+
+        def query(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('''
+                    INSERT INTO users (chat_id, tz) VALUES (?, ?)
+                    ON CONFLICT (chat_id) DO UPDATE SET tz = excluded.tz
+                ''', (chat_id, tz_name))
+                reminders = conn.execute('SELECT id, rule, time, created_at FROM reminders WHERE chat_id = ? AND is_sent = FALSE', (chat_id,)).fetchall()
+                conn.executemany('UPDATE reminders SET reminder_datetime = ? WHERE id = ?', [
+                    (next_fire(rule, time_str, now, zone, self._created(created_at)), reminder_id)
+                    for reminder_id, rule, time_str, created_at in reminders
+                ])
+                schedule = conn.execute('SELECT id, day, time FROM schedule WHERE user_id = ?', (chat_id,)).fetchall()
+                conn.executemany('UPDATE schedule SET next_fire_at = ? WHERE id = ?', [
+                    (next_fire(f"weekly:{day}", time_str, now, zone), item_id) for item_id, day, time_str in schedule
+                ])
+                digest_time = conn.execute('SELECT digest_time FROM users WHERE chat_id = ?', (chat_id,)).fetchone()[0]
+                if digest_time:
+                    conn.execute('UPDATE users SET digest_next_at = ? WHERE chat_id = ?', (next_fire("daily", digest_time, now, zone), chat_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        await self._write(query)
+        self._invalidate(chat_id)
+        self._notify("reminder", now)
+        self._notify("schedule", now)
+        self._notify("digest", now)
+
+    async def set_digest(self, chat_id, time_str):
+        """Включает ежедневную сводку в ЧЧ:ММ по местному времени или выключает её (time_str=None)"""
+        now = utc_now()
+
+        def query(conn):
+            fire_at = None
+            if time_str:
+                fire_at = next_fire("daily", time_str, now, user_zone(self._user_tz(conn, chat_id)))
+            conn.execute('''
+                INSERT INTO users (chat_id, digest_time, digest_next_at) VALUES (?, ?, ?)
+                ON CONFLICT (chat_id) DO UPDATE SET digest_time = excluded.digest_time, digest_next_at = excluded.digest_next_at
+            ''', (chat_id, time_str, fire_at))
+            conn.commit()
+            return fire_at
+        fire_at = await self._write(query)
+        if fire_at is not None:
+            self._notify("digest", fire_at)
+        return fire_at
+
+    async def get_digest_time(self, chat_id):
+        def query(conn):
+            row = conn.execute('SELECT digest_time FROM users WHERE chat_id = ?', (chat_id,)).fetchone()
+            return row[0] if row else None
+        return await self._read(query)
+
+    async def get_due_digests(self, now):
+        def query(conn):
+            rows = conn.execute('SELECT chat_id, digest_next_at FROM users WHERE digest_next_at <= ?', (now,)).fetchall()
+            return [(chat_id, datetime.fromisoformat(fire_at)) for chat_id, fire_at in rows]
+        return await self._read(query)
+
+    async def get_next_digest_time(self, after=None):
+        def query(conn):
+            if after is None:
+                cursor = conn.execute('SELECT MIN(digest_next_at) FROM users')
+            else:
+                cursor = conn.execute('SELECT MIN(digest_next_at) FROM users WHERE digest_next_at > ?', (after,))
+            value = cursor.fetchone()[0]
+            return datetime.fromisoformat(value) if value else None
+        return await self._read(query)
+
+    async def enqueue_digests(self, now, digests, parse_mode=None):
+        """Ставит сводки в outbox и переносит их на завтра одной транзакцией.
+
+        digests - (chat_id, срок, текст или None, если слать нечего). Сводка,
+        срок которой успел измениться (/digest, /tz), пропускается.
+        """
+        def query(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                added = 0
+                for chat_id, fire_at, text in digests:
+                    row = conn.execute(
+                        'SELECT digest_time, tz FROM users WHERE chat_id = ? AND digest_next_at = ?', (chat_id, fire_at)
+                    ).fetchone()
+                    if row is None:
+                        continue
+                    digest_time, tz = row
+                    conn.execute(
+                        'UPDATE users SET digest_next_at = ? WHERE chat_id = ?',
+                        (next_fire("daily", digest_time, now, user_zone(tz)), chat_id)
+                    )
+                    if text:
+                        added += conn.execute(
+                            'INSERT OR IGNORE INTO outbox (idempotency_key, chat_id, text, fire_at, parse_mode) VALUES (?, ?, ?, ?, ?)',
+                            (f"d:{chat_id}:{fire_at}", chat_id, text, fire_at, parse_mode)
+                        ).rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return added
+        return await self._write(query)
+
+    async def add_task(self, chat_id, text):
+        def query(conn):
+            conn.execute('INSERT INTO tasks (chat_id, text) VALUES (?, ?)', (chat_id, text))
             conn.commit()
             return True
-    
-    def get_tasks(self, chat_id, show_done=False):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        result = await self._write(query)
+        self._invalidate(chat_id)
+        return result
+
+    async def add_tasks(self, chat_id, texts):
+        """Добавляет пачку задач одним executemany в одной транзакции"""
+        def query(conn):
+            with conn:
+                conn.executemany('INSERT INTO tasks (chat_id, text) VALUES (?, ?)', [(chat_id, text) for text in texts])
+            return len(texts)
+        added = await self._write(query)
+        self._invalidate(chat_id)
+        return added
+
+    async def get_tasks(self, chat_id, show_done=False, limit=-1, offset=0):
+        def query(conn):
             if show_done:
-                cursor.execute('SELECT id, text, is_done FROM tasks WHERE chat_id = ? ORDER BY created_at DESC', (chat_id,))
+                cursor = conn.execute('SELECT id, text, is_done FROM tasks WHERE chat_id = ? ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?', (chat_id, limit, offset))
             else:
-                cursor.execute('SELECT id, text, is_done FROM tasks WHERE chat_id = ? AND is_done = FALSE ORDER BY created_at DESC', (chat_id,))
+                cursor = conn.execute('SELECT id, text, is_done FROM tasks WHERE chat_id = ? AND is_done = FALSE ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?', (chat_id, limit, offset))
             return cursor.fetchall()
-    
-    def mark_task_done(self, task_id, chat_id):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('UPDATE tasks SET is_done = TRUE WHERE id = ? AND chat_id = ?', (task_id, chat_id))
+        return await self._read(query)
+
+    async def count_tasks(self, chat_id):
+        def query(conn):
+            return conn.execute('SELECT COUNT(*) FROM tasks WHERE chat_id = ? AND is_done = FALSE', (chat_id,)).fetchone()[0]
+        return await self._read(query)
+
+    async def mark_task_done(self, task_id, chat_id):
+        """Отмечает задачу выполненной; текст задачи или None, если она уже выполнена или чужая"""
+        def query(conn):
+            row = conn.execute(
+                'UPDATE tasks SET is_done = TRUE, done_at = CURRENT_TIMESTAMP WHERE id = ? AND chat_id = ? AND is_done = FALSE RETURNING text',
+                (task_id, chat_id)
+            ).fetchone()
             conn.commit()
-            return cursor.rowcount > 0
-    
-    def delete_task(self, task_id, chat_id):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM tasks WHERE id = ? AND chat_id = ?', (task_id, chat_id))
+            return row[0] if row else None
+        text = await self._write(query)
+        if text is not None:
+            self._invalidate(chat_id)
+        return text
+
+    async def mark_all_tasks_done(self, chat_id):
+        def query(conn):
+            cursor = conn.execute('UPDATE tasks SET is_done = TRUE, done_at = CURRENT_TIMESTAMP WHERE chat_id = ? AND is_done = FALSE', (chat_id,))
+            conn.commit()
+            return cursor.rowcount
+        updated = await self._write(query)
+        if updated:
+            self._invalidate(chat_id)
+        return updated
+
+    async def delete_done_tasks(self, chat_id):
+        def query(conn):
+            cursor = conn.execute('DELETE FROM tasks WHERE chat_id = ? AND is_done = TRUE', (chat_id,))
+            conn.commit()
+            return cursor.rowcount
+        deleted = await self._write(query)
+        if deleted:
+            self._invalidate(chat_id)
+        return deleted
+
+    async def delete_task(self, task_id, chat_id):
+        def query(conn):
+            cursor = conn.execute('DELETE FROM tasks WHERE id = ? AND chat_id = ?', (task_id, chat_id))
             conn.commit()
             return cursor.rowcount > 0
-    
-    def add_reminder(self, chat_id, name, time_str):
-        current_dt = datetime.now()
+        deleted = await self._write(query)
+        if deleted:
+            self._invalidate(chat_id)
+        return deleted
+
+    async def add_reminder(self, chat_id, name, time_str, rule="once"):
         try:
-            reminder_time = datetime.strptime(time_str, '%H:%M')
-            reminder_dt = current_dt.replace(hour=reminder_time.hour, minute=reminder_time.minute, second=0, microsecond=0)
-            if reminder_dt <= current_dt:
-                reminder_dt += timedelta(days=1)
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('INSERT INTO reminders (chat_id, name, time, reminder_datetime) VALUES (?, ?, ?, ?)', (chat_id, name, time_str, reminder_dt))
-                conn.commit()
-                return True
+            datetime.strptime(time_str, '%H:%M')
         except ValueError:
             return False
-    
-    def get_user_reminders(self, chat_id):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, name, time, is_sent FROM reminders WHERE chat_id = ? ORDER BY time', (chat_id,))
+        if not is_valid_rule(rule):
+            return False
+        now = utc_now()
+
+        def query(conn):
+            # reminder_datetime - предвычисленное время следующего срабатывания в UTC
+            reminder_dt = next_fire(rule, time_str, now, user_zone(self._user_tz(conn, chat_id)))
+            # created_at пишется явно: от него отсчитываются повторы every:N
+            conn.execute('INSERT INTO reminders (chat_id, name, time, reminder_datetime, rule, created_at) VALUES (?, ?, ?, ?, ?, ?)', (chat_id, name, time_str, reminder_dt, rule, now))
+            conn.commit()
+            return reminder_dt
+        reminder_dt = await self._write(query)
+        self._invalidate(chat_id)
+        self._notify("reminder", reminder_dt)
+        return True
+
+    async def get_user_reminders(self, chat_id):
+        def query(conn):
+            cursor = conn.execute('SELECT id, name, time, is_sent FROM reminders WHERE chat_id = ? AND is_sent = FALSE ORDER BY time', (chat_id,))
             return cursor.fetchall()
-    
-    def get_due_reminders(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, chat_id, name, time, is_sent FROM reminders WHERE is_sent = FALSE AND reminder_datetime <= ?', (datetime.now(),))
+        return await self._read(query)
+
+    async def get_due_reminders(self):
+        now = utc_now()
+
+        def query(conn):
+            cursor = conn.execute('SELECT id, chat_id, name, time, is_sent FROM reminders WHERE is_sent = FALSE AND reminder_datetime <= ?', (now,))
             return cursor.fetchall()
-    
-    def mark_reminder_sent(self, reminder_id):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('UPDATE reminders SET is_sent = TRUE WHERE id = ?', (reminder_id,))
-            conn.commit()
-    
-    def delete_reminder(self, reminder_id, chat_id):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM reminders WHERE id = ? AND chat_id = ?', (reminder_id, chat_id))
+        return await self._read(query)
+
+    async def get_next_reminder_time(self, after=None):
+        def query(conn):
+            if after is None:
+                cursor = conn.execute('SELECT MIN(reminder_datetime) FROM reminders WHERE is_sent = FALSE')
+            else:
+                cursor = conn.execute('SELECT MIN(reminder_datetime) FROM reminders WHERE is_sent = FALSE AND reminder_datetime > ?', (after,))
+            value = cursor.fetchone()[0]
+            return datetime.fromisoformat(value) if value else None
+        return await self._read(query)
+
+    async def mark_reminder_sent(self, reminder_id):
+        await self.mark_reminders_sent([reminder_id])
+
+    @staticmethod
+    def _created(value):
+        return datetime.fromisoformat(value) if value else None
+
+    @classmethod
+    def _advance_reminders(cls, conn, rows, now):
+        """Закрывает разовые напоминания и переносит повторяющиеся; rows - (id, chat_id, rule, time, tz, created_at)"""
+        once = [(reminder_id,) for reminder_id, _, rule, _, _, _ in rows if rule == 'once']
+        recurring = [
+            (next_fire(rule, time_str, now, user_zone(tz), cls._created(created_at)), reminder_id)
+            for reminder_id, _, rule, time_str, tz, created_at in rows if rule != 'once'
+        ]
+        conn.executemany('UPDATE reminders SET is_sent = TRUE WHERE id = ?', once)
+        conn.executemany('UPDATE reminders SET reminder_datetime = ? WHERE id = ?', recurring)
+        return min((fire_at for fire_at, _ in recurring), default=None)
+
+    async def mark_reminders_sent(self, reminder_ids):
+        """Закрывает разовые напоминания, а повторяющиеся переносит на следующее срабатывание"""
+        now = utc_now()
+
+        def query(conn):
+            placeholders = ",".join("?" * len(reminder_ids))
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute(f'''
+                    SELECT r.id, r.chat_id, r.rule, r.time, u.tz, r.created_at FROM reminders r
+                    LEFT JOIN users u ON u.chat_id = r.chat_id
+                    WHERE r.id IN ({placeholders})
+                ''', list(reminder_ids)).fetchall()
+                next_time = self._advance_reminders(conn, rows, now)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return {row[1] for row in rows}, next_time
+        chat_ids, next_time = await self._write(query)
+        for chat_id in chat_ids:
+            self._invalidate(chat_id)
+        if next_time is not None:
+            self._notify("reminder", next_time)
+
+    async def delete_reminder(self, reminder_id, chat_id):
+        def query(conn):
+            cursor = conn.execute('DELETE FROM reminders WHERE id = ? AND chat_id = ?', (reminder_id, chat_id))
             conn.commit()
             return cursor.rowcount > 0
-    def add_schedule_item(self, user_id, day, time, text):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO schedule (user_id, day, time, text) VALUES (?, ?, ?, ?)",
-                (user_id, day, time, text)
+        deleted = await self._write(query)
+        if deleted:
+            self._invalidate(chat_id)
+            self._notify("reminder")
+        return deleted
+
+    async def add_schedule_item(self, user_id, day, time, text):
+        now = utc_now()
+
+        def query(conn):
+            fire_at = next_fire(f"weekly:{day}", time, now, user_zone(self._user_tz(conn, user_id)))
+            conn.execute(
+                "INSERT INTO schedule (user_id, day, time, text, next_fire_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, day, time, text, fire_at)
             )
             conn.commit()
-    def get_schedule_for_now(self, day, time):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT user_id, text FROM schedule WHERE day = ? AND time = ?",
-                (day, time)
+            return fire_at
+        fire_at = await self._write(query)
+        self._invalidate(user_id)
+        self._notify("schedule", fire_at)
+
+    async def get_list_view(self, chat_id, cursor=None, page_size=10, section_limit=50, cached=True):
+        """Страница списка дел одним чтением: (задачи, курсор назад, курсор вперёд, напоминания, расписание).
+
+        Задачи листаются по ключу (created_at, id), без OFFSET и COUNT(*),
+        поэтому страница стоит page_size строк на любой глубине. cursor -
+        None для первой страницы, ("n", created_at, id) для задач старше
+        этой и ("p", created_at, id) для задач новее неё. Курсоры в ответе -
+        (created_at, id) крайних задач или None, если листать некуда.
+        Напоминания и расписание (не больше section_limit строк) входят только
+        в первую страницу. Страницы кэшируются до первой записи в чат;
+        cached=False читает мимо кэша (чат могли изменить другие процессы).
+        """
+        pages = self.list_cache.get(chat_id)
+        if cached:
+            if pages is not None and cursor in pages:
+                self.list_cache_hits += 1
+                return pages[cursor]
+            self.list_cache_misses += 1
+        generation = self._list_generation
+
+        def key(row):
+            return row[3], row[0]
+
+        def query(conn):
+            select = 'SELECT id, text, is_done, created_at FROM tasks WHERE chat_id = ? AND is_done = FALSE'
+            limit = page_size + 1
+
+            def beyond(op, order):
+                # (created_at, id) op курсор. Строковое сравнение (created_at, id) < (?, ?)
+                # SQLite не сводит к поиску по индексу (id - это rowid) и перебирает
+                # все задачи с той же секундой, поэтому два запроса по индексу
+                created_at, task_id = cursor[1], cursor[2]
+                rows = conn.execute(
+                    f'{select} AND created_at = ? AND id {op} ? ORDER BY id {order} LIMIT ?',
+                    (chat_id, created_at, task_id, limit)
+                ).fetchall()
+                rows += conn.execute(
+                    f'{select} AND created_at {op} ? ORDER BY created_at {order}, id {order} LIMIT ?',
+                    (chat_id, created_at, limit - len(rows))
+                ).fetchall() if len(rows) < limit else []
+                return rows
+
+            direction = cursor[0] if cursor else None
+            if direction == "p":
+                rows = beyond(">", "ASC")
+                page_rows = rows[:page_size][::-1]
+                prev_cursor = key(page_rows[0]) if len(rows) > page_size else None
+                next_cursor = key(page_rows[-1]) if page_rows else None
+                # Дошли до начала списка: отдаём первую страницу целиком
+                if prev_cursor is None:
+                    direction = None
+            if direction != "p":
+                if direction == "n":
+                    rows = beyond("<", "DESC")
+                else:
+                    rows = conn.execute(f'{select} ORDER BY created_at DESC, id DESC LIMIT ?', (chat_id, limit)).fetchall()
+                page_rows = rows[:page_size]
+                prev_cursor = key(page_rows[0]) if direction == "n" and page_rows else None
+                next_cursor = key(page_rows[-1]) if len(rows) > page_size else None
+            reminders, schedule = [], []
+            if prev_cursor is None:
+                reminders = conn.execute('SELECT id, name, time, is_sent, rule FROM reminders WHERE chat_id = ? AND is_sent = FALSE ORDER BY time LIMIT ?', (chat_id, section_limit)).fetchall()
+                schedule = conn.execute("SELECT day, time, text FROM schedule WHERE user_id = ? ORDER BY day, time LIMIT ?", (chat_id, section_limit)).fetchall()
+            tasks = [row[:3] for row in page_rows]
+            return tasks, prev_cursor, next_cursor, reminders, schedule
+        view = await self._read(query)
+        # Если пока шло чтение что-то изменилось, результат может быть устаревшим
+        if generation == self._list_generation:
+            if pages is None:
+                pages = {}
+                self.list_cache.set(chat_id, pages)
+            pages[cursor] = view
+        return view
+
+    async def enqueue_due(self, now, reminder_text, schedule_text):
+        """Переносит всё наступившее к now в outbox одной транзакцией.
+
+        В той же транзакции разовые напоминания закрываются, повторяющиеся и
+        расписание переносятся на следующее срабатывание, а now запоминается
+        как последний обработанный тик. Ключ идемпотентности (пункт + срок)
+        не даёт повторно поставить одно и то же срабатывание. Возвращает
+        число новых записей outbox.
+        """
+        def query(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                reminders = conn.execute('''
+                    SELECT r.id, r.chat_id, r.rule, r.time, u.tz, r.created_at, r.name, r.reminder_datetime FROM reminders r
+                    LEFT JOIN users u ON u.chat_id = r.chat_id
+                    WHERE r.is_sent = FALSE AND r.reminder_datetime <= ?
+                ''', (now,)).fetchall()
+                schedule = conn.execute('''
+                    SELECT s.id, s.user_id, s.day, s.time, s.text, u.tz, s.next_fire_at FROM schedule s
+                    LEFT JOIN users u ON u.chat_id = s.user_id
+                    WHERE s.next_fire_at <= ?
+                ''', (now,)).fetchall()
+
+                outbox = [
+                    (f"r:{reminder_id}:{fire_at}", chat_id, reminder_text.format(name=name), fire_at)
+                    for reminder_id, chat_id, _, _, _, _, name, fire_at in reminders
+                ] + [
+                    (f"s:{item_id}:{fire_at}", user_id, schedule_text.format(day=day, text=text), fire_at)
+                    for item_id, user_id, day, _, text, _, fire_at in schedule
+                ]
+                added = conn.total_changes
+                conn.executemany(
+                    'INSERT OR IGNORE INTO outbox (idempotency_key, chat_id, text, fire_at) VALUES (?, ?, ?, ?)',
+                    outbox
+                )
+                added = conn.total_changes - added
+
+                self._advance_reminders(conn, [row[:6] for row in reminders], now)
+                conn.executemany(
+                    "UPDATE schedule SET next_fire_at = ? WHERE id = ?",
+                    [(next_fire(f"weekly:{day}", time_str, now, user_zone(tz)), item_id)
+                     for item_id, _, day, time_str, _, tz, _ in schedule]
+                )
+                conn.execute(
+                    "INSERT INTO scheduler_state (key, value) VALUES ('last_tick', ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                    (now,)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return added, {row[1] for row in reminders}
+        added, chat_ids = await self._write(query)
+        for chat_id in chat_ids:
+            self._invalidate(chat_id)
+        return added
+
+    async def get_last_tick(self):
+        def query(conn):
+            row = conn.execute("SELECT value FROM scheduler_state WHERE key = 'last_tick'").fetchone()
+            return datetime.fromisoformat(row[0]) if row else None
+        return await self._read(query)
+
+    async def claim_outbox(self, limit, owner, timeout=600):
+        """Забирает до limit ожидающих записей outbox в работу, старые сроки первыми.
+
+        Заодно возвращает в очередь записи, которые держит процесс без живой
+        аренды delivery:<owner> (упал, не отпустив их) или держит дольше
+        timeout секунд. Записи живых соседей не трогаются, поэтому смена
+        лидера не дублирует сообщения, которые ещё отправляются.
+        """
+        now = time.time()
+
+        def query(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('''
+                    UPDATE outbox SET state = 'pending', updated_at = CURRENT_TIMESTAMP
+                    WHERE state = 'sending' AND (
+                        claimed_at IS NULL OR claimed_at < ? OR NOT EXISTS (
+                            SELECT 1 FROM leases WHERE name = 'delivery:' || outbox.claimed_by AND expires_at >= ?
+                        )
+                    )
+                ''', (now - timeout, now))
+                rows = conn.execute('''
+                    UPDATE outbox SET state = 'sending', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP,
+                        claimed_by = ?, claimed_at = ?
+                    WHERE id IN (SELECT id FROM outbox WHERE state = 'pending' ORDER BY fire_at, id LIMIT ?)
+                    RETURNING id, chat_id, text, fire_at, parse_mode
+                ''', (owner, now, limit)).fetchall()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            # Порядок строк RETURNING не определён
+            rows.sort(key=lambda row: (row[3], row[0]))
+            return [(outbox_id, chat_id, text, parse_mode) for outbox_id, chat_id, text, _, parse_mode in rows]
+        return await self._write(query)
+
+    async def complete_outbox(self, sent_ids, failed_ids=()):
+        def query(conn):
+            for state, ids in (('sent', sent_ids), ('failed', failed_ids)):
+                conn.executemany(
+                    'UPDATE outbox SET state = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                    [(state, outbox_id) for outbox_id in ids]
+                )
+            conn.commit()
+        await self._write(query)
+
+    async def release_outbox(self, owner):
+        """Возвращает в очередь записи, которые owner взял и не успел отправить"""
+        def query(conn):
+            cursor = conn.execute(
+                "UPDATE outbox SET state = 'pending', updated_at = CURRENT_TIMESTAMP WHERE state = 'sending' AND claimed_by = ?",
+                (owner,)
             )
-            return cursor.fetchall()
-        
-    def get_full_schedule(self, user_id):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+            conn.commit()
+            return cursor.rowcount
+        return await self._write(query)
+
+    async def count_outbox(self, state='pending'):
+        def query(conn):
+            return conn.execute('SELECT COUNT(*) FROM outbox WHERE state = ?', (state,)).fetchone()[0]
+        return await self._read(query)
+
+    async def get_next_schedule_time(self, after=None):
+        def query(conn):
+            if after is None:
+                cursor = conn.execute("SELECT MIN(next_fire_at) FROM schedule")
+            else:
+                cursor = conn.execute("SELECT MIN(next_fire_at) FROM schedule WHERE next_fire_at > ?", (after,))
+            value = cursor.fetchone()[0]
+            return datetime.fromisoformat(value) if value else None
+        return await self._read(query)
+
+    async def get_full_schedule(self, user_id):
+        def query(conn):
+            cursor = conn.execute(
                 "SELECT day, time, text FROM schedule WHERE user_id = ? ORDER BY day, time",
                 (user_id,)
             )
-            return cursor.fetchall()
\ No newline at end of file
+            return cursor.fetchall()
+        return await self._read(query)
+
+    async def archive_tasks(self, before, limit, keep=True):
+        """Переносит до limit задач, выполненных раньше before, в архив (или удаляет при keep=False)"""
+        def query(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute(
+                    'SELECT id, chat_id FROM tasks WHERE is_done = TRUE AND done_at < ? LIMIT ?', (before, limit)
+                ).fetchall()
+                ids = [(row_id,) for row_id, _ in rows]
+                if keep:
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO tasks_archive (id, chat_id, text, created_at, done_at)
+                        SELECT id, chat_id, text, created_at, done_at FROM tasks WHERE id = ?
+                    ''', ids)
+                conn.executemany('DELETE FROM tasks WHERE id = ?', ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return len(rows), {chat_id for _, chat_id in rows}
+        count, chat_ids = await self._write(query)
+        for chat_id in chat_ids:
+            self._invalidate(chat_id)
+        return count
+
+    async def archive_reminders(self, before, limit, keep=True):
+        """То же для отправленных напоминаний, срок которых прошёл раньше before"""
+        def query(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                ids = conn.execute(
+                    'SELECT id FROM reminders WHERE is_sent = TRUE AND reminder_datetime < ? LIMIT ?', (before, limit)
+                ).fetchall()
+                if keep:
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO reminders_archive (id, chat_id, name, time, rule, reminder_datetime, created_at)
+                        SELECT id, chat_id, name, time, rule, reminder_datetime, created_at FROM reminders WHERE id = ?
+                    ''', ids)
+                conn.executemany('DELETE FROM reminders WHERE id = ?', ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return len(ids)
+        return await self._write(query)
+
+    async def purge_outbox(self, before, limit):
+        def query(conn):
+            cursor = conn.execute('''
+                DELETE FROM outbox WHERE id IN (
+                    SELECT id FROM outbox WHERE state IN ('sent', 'failed') AND fire_at < ? LIMIT ?
+                )
+            ''', (before, limit))
+            conn.commit()
+            return cursor.rowcount
+        return await self._write(query)
+
+    async def incremental_vacuum(self, pages=1000):
+        """Возвращает в ОС до pages свободных страниц; сколько свободных осталось"""
+        def query(conn):
+            conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+            return conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return await self._write(query)
+
+    async def get_history(self, chat_id, limit=20):
+        """Последние выполненные задачи (и из архива, и ещё не перенесённые) и отправленные напоминания"""
+        def query(conn):
+            tasks = conn.execute('''
+                SELECT text, done_at FROM tasks WHERE chat_id = ? AND is_done = TRUE
+                UNION ALL
+                SELECT text, done_at FROM tasks_archive WHERE chat_id = ?
+                ORDER BY done_at DESC LIMIT ?
+            ''', (chat_id, chat_id, limit)).fetchall()
+            reminders = conn.execute('''
+                SELECT name, reminder_datetime FROM reminders WHERE chat_id = ? AND is_sent = TRUE
+                UNION ALL
+                SELECT name, reminder_datetime FROM reminders_archive WHERE chat_id = ?
+                ORDER BY reminder_datetime DESC LIMIT ?
+            ''', (chat_id, chat_id, limit)).fetchall()
+            return tasks, reminders
+        return await self._read(query)
+
+    @staticmethod
+    def _fts_query(chat_id, text):
+        """Запрос MATCH: все слова как префиксы в документах владельца"""
+        words = re.findall(r"\w+", text.lower().replace("ё", "е"))
+        if not words:
+            return None
+        terms = " ".join(f'"{search_stem(word)}"*' for word in words[:10])
+        return f'owner : "u{chat_id}" AND body : ({terms})'
+
+    async def search(self, chat_id, text, limit=10, offset=0):
+        """Найденные задачи, напоминания и пункты расписания по релевантности (bm25): (строки, всего)"""
+        match = self._fts_query(chat_id, text)
+        if match is None:
+            return [], 0
+
+        def query(conn):
+            total = conn.execute('SELECT COUNT(*) FROM search_index WHERE search_index MATCH ?', (match,)).fetchone()[0]
+            rows = conn.execute('''
+                SELECT kind, item_id, CASE kind
+                    WHEN 'task' THEN (SELECT text FROM tasks WHERE id = item_id)
+                    WHEN 'reminder' THEN (SELECT name || ' в ' || time FROM reminders WHERE id = item_id)
+                    ELSE (SELECT day || ' ' || time || ' — ' || text FROM schedule WHERE id = item_id)
+                END
+                FROM search_index WHERE search_index MATCH ?
+                ORDER BY bm25(search_index, 1.0, 0.0) LIMIT ? OFFSET ?
+            ''', (match, limit, offset)).fetchall()
+            return rows, total
+        return await self._read(query)
+
+    async def export_user_data(self, chat_id, path, fmt="json"):
+        """Выгружает задачи, напоминания и расписание пользователя в файл path.
+
+        Строки читаются курсорами внутри одной читающей транзакции (единый
+        снимок в WAL) и сразу пишутся в файл. Возвращает число записей.
+        """
+        def query(conn):
+            conn.execute('BEGIN')
+            try:
+                tasks = conn.execute('SELECT text, is_done, created_at FROM tasks WHERE chat_id = ? ORDER BY id', (chat_id,))
+                reminders = conn.execute('SELECT name, time, rule, is_sent FROM reminders WHERE chat_id = ? ORDER BY id', (chat_id,))
+                schedule = conn.execute('SELECT day, time, text FROM schedule WHERE user_id = ? ORDER BY id', (chat_id,))
+                with open(path, "w", encoding="utf-8", newline="") as f:
+                    return (write_csv if fmt == "csv" else write_json)(f, tasks, reminders, schedule)
+            finally:
+                conn.commit()
+        return await self._read(query)
+
+    async def import_user_data(self, chat_id, tasks, reminders, schedule):
+        """Добавляет импортированные записи одной транзакцией; сроки считаются в зоне пользователя"""
+        now = utc_now()
+
+        def query(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                zone = user_zone(self._user_tz(conn, chat_id))
+                conn.executemany(
+                    "INSERT INTO tasks (chat_id, text, is_done, done_at) VALUES (?, ?, ?, CASE WHEN ? THEN CURRENT_TIMESTAMP END)",
+                    [(chat_id, text, is_done, is_done) for text, is_done in tasks]
+                )
+                conn.executemany(
+                    "INSERT INTO reminders (chat_id, name, time, reminder_datetime, rule, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(chat_id, name, time_str, next_fire(rule, time_str, now, zone), rule, now) for name, time_str, rule in reminders]
+                )
+                conn.executemany(
+                    "INSERT INTO schedule (user_id, day, time, text, next_fire_at) VALUES (?, ?, ?, ?, ?)",
+                    [(chat_id, day, time_str, text, next_fire(f"weekly:{day}", time_str, now, zone)) for day, time_str, text in schedule]
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        await self._write(query)
+        self._invalidate(chat_id)
+        if reminders:
+            self._notify("reminder", now)
+        if schedule:
+            self._notify("schedule", now)
+
+    async def backup(self, path, pages=1000, sleep=0.05):
+        """Онлайн-копия базы в path через sqlite3 backup API порциями по pages страниц.
+
+        Источник держит читающую транзакцию, поэтому копируется один снимок
+        WAL: писатели не ждут, а копирование не начинается заново после
+        каждой их записи. Выполняется в отдельном потоке, не занимая пул.
+        """
+        def run():
+            source = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            target = sqlite3.connect(path)
+            try:
+                source.execute('BEGIN')
+                source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                source.backup(target, pages=pages, sleep=sleep)
+                source.execute('COMMIT')
+                return target.execute('PRAGMA page_count').fetchone()[0]
+            finally:
+                target.close()
+                source.close()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, run)
+
+    async def get_fsm_record(self, key, not_before):
+        def query(conn):
+            cursor = conn.execute('SELECT state, data FROM fsm_states WHERE key = ? AND updated_at >= ?', (key, not_before))
+            row = cursor.fetchone()
+            return (row[0], json.loads(row[1])) if row else (None, {})
+        return await self._read(query)
+
+    async def save_fsm_record(self, key, state, data):
+        payload = json.dumps(data, ensure_ascii=False)
+
+        def query(conn):
+            conn.execute('''
+                INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            ''', (key, state, payload, time.time()))
+            conn.commit()
+        await self._write(query)
+
+    async def delete_fsm_record(self, key):
+        def query(conn):
+            conn.execute('DELETE FROM fsm_states WHERE key = ?', (key,))
+            conn.commit()
+        await self._write(query)
+
+    async def purge_fsm_records(self, older_than):
+        def query(conn):
+            cursor = conn.execute('DELETE FROM fsm_states WHERE updated_at < ?', (older_than,))
+            conn.commit()
+            return cursor.rowcount
+        return await self._write(query)
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from metrics import (
+    DELIVERY_MERGED, DELIVERY_MESSAGES, DELIVERY_QUEUE_DEPTH, OUTBOX_PENDING, TELEGRAM_ERRORS, TELEGRAM_RETRIES,
+)
+from utils import MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Token bucket: в среднем rate событий в секунду, не больше burst подряд"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+@dataclass
+class Notification:
+    """Одно исходящее сообщение, в которое могут быть склеены несколько записей outbox"""
+    chat_id: int
+    texts: list
+    outbox_ids: list
+    parse_mode: Optional[str] = None
+    attempt: int = 0
+
+    @property
+    def text(self):
+        return "\n\n".join(self.texts)
+
+    def merge(self, outbox_id, text, parse_mode):
+        if parse_mode != self.parse_mode or len(self.text) + 2 + len(text) > MESSAGE_LIMIT:
+            return False
+        self.texts.append(text)
+        self.outbox_ids.append(outbox_id)
+        return True
+
+class DeliveryQueue:
+    """Доставка уведомлений из outbox с ограниченным параллелизмом.
+
+    Записи забираются из базы пачками (pending -> sending) не быстрее, чем
+    воркеры успевают их отправить, поэтому большой хвост после простоя
+    разгружается с обычной скоростью. Соблюдает общий лимит Telegram и
+    интервал между сообщениями в один чат, повторяет каждое сообщение
+    отдельно (RetryAfter, сетевые ошибки), а итог (sent/failed) пишет
+    в базу пачками. Уведомления одного чата, наступившие в один тик или
+    пришедшие, пока его сообщение ждёт очереди, склеиваются в одно.
+
+    Очередь есть в каждом экземпляре бота. Взятые записи помечаются
+    владельцем, а сам экземпляр держит аренду delivery:<owner>: пока она
+    жива, чужие записи в sending никто не трогает, а после падения их
+    подберут соседи. При остановке неотправленное возвращается в pending.
+    """
+
+    def __init__(self, bot, db, workers=16, global_rate=30, chat_interval=1.0,
+                 max_attempts=5, flush_interval=0.5, flush_size=500, batch_size=100, poll_interval=30,
+                 lease_ttl=30, claim_timeout=600):
+        self.bot = bot
+        self.db = db
+        # Перезапущенный контейнер получает те же hostname и pid: без
+        # случайной части он принял бы аренду прошлого запуска за свою
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self.lease_name = f"delivery:{self.owner}"
+        self.lease_ttl = lease_ttl
+        self.claim_timeout = claim_timeout
+        self.workers = workers
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        # В памяти держим не больше пары сообщений на воркер: остальное ждёт в базе
+        self._capacity = max(batch_size, 2 * workers)
+        self._limiter = RateLimiter(global_rate)
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._chat_next = {}
+        self._waiting = {}
+        self._paused_until = 0.0
+        self._sent_ids = []
+        self._failed_ids = []
+        self._flush_lock = asyncio.Lock()
+        self._tasks = []
+        self.sent = 0
+        self.failed = 0
+
+    def wake(self):
+        """В outbox появились новые записи"""
+        self._wakeup.set()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    async def start(self):
+        DELIVERY_QUEUE_DEPTH.set_function(self._queue.qsize)
+        # Аренда нужна до первой выборки, иначе соседи сочтут наши записи брошенными
+        await self.db.acquire_lease(self.lease_name, self.owner, self.lease_ttl)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._feeder()))
+        self._tasks.append(asyncio.create_task(self._flusher()))
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def join(self):
+        await self._queue.join()
+        await self._flush()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._flush()
+        try:
+            released = await self.db.release_outbox(self.owner)
+            await self.db.release_lease(self.lease_name, self.owner)
+        except Exception as e:
+            logger.error(f"Не удалось вернуть уведомления в outbox: {e}")
+        else:
+            if released:
+                logger.info(f"Возвращено в outbox неотправленных уведомлений: {released}")
+        self._queue = asyncio.Queue()
+        self._waiting = {}
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self.db.acquire_lease(self.lease_name, self.owner, self.lease_ttl)
+                # Очередь в памяти ограничена _capacity, поэтому реальный
+                # хвост виден только по outbox
+                OUTBOX_PENDING.set(await self.db.count_outbox())
+            except Exception as e:
+                logger.error(f"Не удалось продлить аренду очереди доставки или посчитать outbox: {e}")
+
+    async def _feeder(self):
+        while True:
+            if self._queue.qsize() > self._capacity // 2:
+                self._drained.clear()
+                await self._drained.wait()
+                continue
+            self._wakeup.clear()
+            limit = min(self.batch_size, self._capacity - self._queue.qsize())
+            try:
+                rows = await self.db.claim_outbox(limit, self.owner, self.claim_timeout)
+            except Exception as e:
+                logger.error(f"Не удалось забрать уведомления из outbox: {e}")
+                rows = []
+            for outbox_id, chat_id, text, parse_mode in rows:
+                self._add(outbox_id, chat_id, text, parse_mode)
+            if len(rows) < limit:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _add(self, outbox_id, chat_id, text, parse_mode=None):
+        # Пока сообщение чата ждёт очереди, новые уведомления дописываются
+        # в него же: десять напоминаний на 09:00 уходят одним сообщением
+        waiting = self._waiting.get(chat_id)
+        if waiting is not None and waiting.merge(outbox_id, text, parse_mode):
+            DELIVERY_MERGED.inc()
+            return
+        item = Notification(chat_id, [text], [outbox_id], parse_mode)
+        self._waiting[chat_id] = item
+        self._queue.put_nowait(item)
+
+    async def _wait_turn(self, chat_id):
+        now = time.monotonic()
+        # Резервируем слот для чата заранее, чтобы сообщения в один чат
+        # уходили по порядку и не чаще chat_interval
+        ready = max(now, self._chat_next.get(chat_id, 0.0), self._paused_until)
+        self._chat_next[chat_id] = ready + self.chat_interval
+        if len(self._chat_next) > 10000:
+            self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+        if ready > now:
+            await asyncio.sleep(ready - now)
+        await self._limiter.acquire()
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            if self._queue.qsize() <= self._capacity // 2:
+                self._drained.set()
+            try:
+                await self._deliver(item)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, item):
+        await self._wait_turn(item.chat_id)
+        if self._waiting.get(item.chat_id) is item:
+            del self._waiting[item.chat_id]
+        try:
+            await self.bot.send_message(item.chat_id, item.text, parse_mode=item.parse_mode)
+        except TelegramRetryAfter as e:
+            TELEGRAM_ERRORS.labels("retry_after").inc()
+            # Флуд-контроль общий для бота: притормаживаем все воркеры
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            self._retry(item, f"RetryAfter {e.retry_after}s", count=False)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            TELEGRAM_ERRORS.labels("network" if isinstance(e, TelegramNetworkError) else "server").inc()
+            await asyncio.sleep(min(2 ** item.attempt, 30))
+            self._retry(item, e)
+        except TelegramBadRequest as e:
+            TELEGRAM_ERRORS.labels("bad_request").inc()
+            if item.parse_mode and "can't parse entities" in str(e):
+                # Разметку сломал пользовательский текст: лучше без форматирования, чем никак
+                logger.warning(f"Разметка сообщения в чат {item.chat_id} не разобрана, отправляем без неё: {e}")
+                item.parse_mode = None
+                self._retry(item, e, count=False)
+                return
+            logger.warning(f"Сообщение в чат {item.chat_id} не доставлено: {e}")
+            self._done(item, delivered=False)
+        except TelegramForbiddenError as e:
+            TELEGRAM_ERRORS.labels("forbidden").inc()
+            logger.warning(f"Сообщение в чат {item.chat_id} не доставлено: {e}")
+            self._done(item, delivered=False)
+        except Exception as e:
+            TELEGRAM_ERRORS.labels("other").inc()
+            logger.error(f"Ошибка отправки в чат {item.chat_id}: {e}")
+            self._retry(item, e)
+        else:
+            self._done(item, delivered=True)
+
+    def _retry(self, item, reason, count=True):
+        if count:
+            item.attempt += 1
+        if item.attempt >= self.max_attempts:
+            logger.error(f"Сообщение в чат {item.chat_id} не доставлено после {item.attempt} попыток: {reason}")
+            self._done(item, delivered=False)
+            return
+        TELEGRAM_RETRIES.inc()
+        self._queue.put_nowait(item)
+
+    def _done(self, item, delivered):
+        if delivered:
+            self.sent += 1
+            self._sent_ids.extend(item.outbox_ids)
+        else:
+            self.failed += 1
+            self._failed_ids.extend(item.outbox_ids)
+        DELIVERY_MESSAGES.labels("sent" if delivered else "failed").inc()
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+
+    async def _flush(self):
+        async with self._flush_lock:
+            while self._sent_ids or self._failed_ids:
+                sent = self._sent_ids[:self.flush_size]
+                failed = self._failed_ids[:self.flush_size]
+                try:
+                    await self.db.complete_outbox(sent, failed)
+                except Exception as e:
+                    logger.error(f"Не удалось записать итог доставки: {e}")
+                    return
+                del self._sent_ids[:len(sent)]
+                del self._failed_ids[:len(failed)]
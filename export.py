@@ -0,0 +1,102 @@
+import csv
+import io
+import json
+
+from recurrence import DAYS, is_valid_rule
+from utils import parse_time
+
+# Формат выгрузки пользователя. Строки пишутся в файл по одной прямо из
+# курсоров SQLite, поэтому память не зависит от объёма данных.
+
+EXPORT_FORMAT = "todo-bot-export"
+EXPORT_VERSION = 1
+CSV_FIELDS = ["kind", "text", "day", "time", "rule", "done"]
+
+def _task(row):
+    text, is_done, created_at = row
+    return {"text": text, "done": bool(is_done), "created_at": created_at}
+
+def _reminder(row):
+    name, time_str, rule, is_sent = row
+    return {"name": name, "time": time_str, "rule": rule, "sent": bool(is_sent)}
+
+def _schedule(row):
+    day, time_str, text = row
+    return {"day": day, "time": time_str, "text": text}
+
+def write_json(f, tasks, reminders, schedule):
+    """tasks, reminders, schedule - итераторы строк (курсоры); возвращает число записанных строк"""
+    count = 0
+    f.write(json.dumps({"format": EXPORT_FORMAT, "version": EXPORT_VERSION})[:-1])
+    for key, rows, convert in (("tasks", tasks, _task), ("reminders", reminders, _reminder), ("schedule", schedule, _schedule)):
+        f.write(f', "{key}": [')
+        for i, row in enumerate(rows):
+            f.write((",\n" if i else "\n") + json.dumps(convert(row), ensure_ascii=False))
+            count += 1
+        f.write("]")
+    f.write("}\n")
+    return count
+
+def write_csv(f, tasks, reminders, schedule):
+    count = 0
+    writer = csv.writer(f)
+    writer.writerow(CSV_FIELDS)
+    for text, is_done, _ in tasks:
+        writer.writerow(["task", text, "", "", "", int(bool(is_done))])
+        count += 1
+    for name, time_str, rule, is_sent in reminders:
+        writer.writerow(["reminder", name, "", time_str, rule, int(bool(is_sent))])
+        count += 1
+    for day, time_str, text in schedule:
+        writer.writerow(["schedule", text, day, time_str, "", ""])
+        count += 1
+    return count
+
+def _valid_time(value):
+    parsed = parse_time(str(value or ""))
+    return f"{parsed[0]:02d}:{parsed[1]:02d}" if parsed else None
+
+def parse_import(filename, content):
+    """Разбирает выгрузку .json/.csv в (задачи, напоминания, расписание).
+
+    Задачи - (текст, выполнена), напоминания - (название, ЧЧ:ММ, правило),
+    расписание - (день, ЧЧ:ММ, текст). Некорректные строки и уже
+    отправленные разовые напоминания пропускаются. ValueError, если файл
+    не похож на выгрузку.
+    """
+    text = content.decode("utf-8-sig", errors="replace")
+    if filename.lower().endswith(".json"):
+        data = json.loads(text)
+        if not isinstance(data, dict) or data.get("format") != EXPORT_FORMAT:
+            raise ValueError("not an export file")
+        rows = (
+            [("task", item.get("text"), None, None, None, item.get("done")) for item in data.get("tasks", [])]
+            + [("reminder", item.get("name"), None, item.get("time"), item.get("rule"), item.get("sent")) for item in data.get("reminders", [])]
+            + [("schedule", item.get("text"), item.get("day"), item.get("time"), None, None) for item in data.get("schedule", [])]
+        )
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        if reader.fieldnames != CSV_FIELDS:
+            raise ValueError("not an export file")
+        rows = [
+            (row["kind"], row["text"], row["day"], row["time"], row["rule"], row["done"] not in ("", "0"))
+            for row in reader
+        ]
+
+    tasks, reminders, schedule = [], [], []
+    for kind, body, day, time_value, rule, done in rows:
+        body = str(body or "").strip()
+        if not body:
+            continue
+        if kind == "task":
+            tasks.append((body, bool(done)))
+        elif kind == "reminder":
+            rule = rule or "once"
+            time_str = _valid_time(time_value)
+            if time_str and is_valid_rule(rule) and not (done and rule == "once"):
+                reminders.append((body, time_str, rule))
+        elif kind == "schedule":
+            time_str = _valid_time(time_value)
+            if time_str and day in DAYS:
+                schedule.append((day, time_str, body))
+    return tasks, reminders, schedule
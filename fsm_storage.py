@@ -0,0 +1,74 @@
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from cache import TTLCache
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в локальной SQLite с write-through LRU-кэшем.
+
+    Горячие get_state/get_data обслуживаются из памяти, каждое изменение
+    сразу пишется в таблицу fsm_states, поэтому незавершённые диалоги
+    переживают перезапуск. Состояния, к которым не обращались дольше
+    state_ttl секунд, считаются брошенными и удаляются.
+    """
+
+    def __init__(self, db, cache_size=10000, cache_ttl=600, state_ttl=7 * 24 * 3600, purge_interval=3600):
+        self.db = db
+        self.state_ttl = state_ttl
+        self.purge_interval = purge_interval
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) for part in (
+            key.bot_id,
+            key.chat_id,
+            key.user_id,
+            key.thread_id or 0,
+            key.business_connection_id or "",
+            key.destiny,
+        ))
+
+    async def _load(self, key: str):
+        record = self._cache.get(key)
+        if record is None:
+            record = await self.db.get_fsm_record(key, time.time() - self.state_ttl)
+            self._cache.set(key, record)
+        return record
+
+    async def _save(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        self._cache.set(key, (state, data))
+        if state is None and not data:
+            await self.db.delete_fsm_record(key)
+        else:
+            await self.db.save_fsm_record(key, state, data)
+
+        now = time.time()
+        if now - self._last_purge > self.purge_interval:
+            self._last_purge = now
+            await self.db.purge_fsm_records(now - self.state_ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = self._key(key)
+        _, data = await self._load(key)
+        await self._save(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        key = self._key(key)
+        state, _ = await self._load(key)
+        await self._save(key, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return dict(data)
+
+    async def close(self) -> None:
+        self._cache.clear()
@@ -1,12 +1,19 @@
 from aiogram import Router
-from . import commands, tasks, reminders, schedule 
+from middlewares import instrument_router
+from . import commands, data, tasks, reminders, schedule, search
 
 def get_handlers_router() -> Router:
     master_router = Router()
     
-    master_router.include_router(tasks.router)
-    master_router.include_router(reminders.router)
-    master_router.include_router(schedule.router)
-    master_router.include_router(commands.router)
+    for name, router in (
+        ("tasks", tasks.router),
+        ("reminders", reminders.router),
+        ("schedule", schedule.router),
+        ("search", search.router),
+        ("data", data.router),
+        ("commands", commands.router),
+    ):
+        instrument_router(router, name)
+        master_router.include_router(router)
     
     return master_router
\ No newline at end of file
@@ -1,16 +1,18 @@
+from datetime import datetime
 from aiogram import Router, types, F
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from database import Database
 from keyboards import create_main_keyboard
+from recurrence import default_timezone, parse_timezone
+from utils import parse_time
 
 router = Router()
-db = Database()
 
 @router.message(Command("start"))
-async def start_handler(message: types.Message):
+async def start_handler(message: types.Message, db: Database):
     user = message.from_user
-    db.add_user(message.chat.id, user.username, user.first_name)
+    await db.add_user(message.chat.id, user.username, user.first_name)
     welcome_text = "🎯 Добро пожаловать в To-Do Bot!\n\nИспользуйте меню ниже 👇"
     await message.answer(welcome_text, reply_markup=create_main_keyboard())
 
@@ -32,6 +34,46 @@ async def cancel_handler_inline(callback: types.CallbackQuery, state: FSMContext
         await callback.message.delete()
     await callback.answer()
 
+@router.message(Command("tz"))
+async def timezone_handler(message: types.Message, command: CommandObject, db: Database):
+    if not command.args:
+        current = await db.get_user_timezone(message.chat.id) or default_timezone()
+        await message.answer(
+            f"🌍 Ваш часовой пояс: {current}\n"
+            "Чтобы изменить, отправьте /tz Europe/Moscow или /tz +3"
+        )
+        return
+    zone = parse_timezone(command.args)
+    if zone is None:
+        await message.answer("❌ Не знаю такой часовой пояс. Примеры: Europe/Moscow, Asia/Yekaterinburg, +5")
+        return
+    await db.set_user_timezone(message.chat.id, zone.key)
+    local_time = datetime.now(zone).strftime("%H:%M")
+    await message.answer(f"🌍 Часовой пояс установлен: {zone.key} (сейчас у вас {local_time})")
+
+@router.message(Command("digest"))
+async def digest_handler(message: types.Message, command: CommandObject, db: Database):
+    args = (command.args or "").strip().lower()
+    if not args:
+        current = await db.get_digest_time(message.chat.id)
+        status = f"приходит в {current}" if current else "выключена"
+        await message.answer(
+            f"☀️ Утренняя сводка {status}.\n"
+            "Включить: /digest 08:30, выключить: /digest off"
+        )
+        return
+    if args in ("off", "выкл", "нет"):
+        await db.set_digest(message.chat.id, None)
+        await message.answer("☀️ Утренняя сводка выключена")
+        return
+    time_data = parse_time(args)
+    if not time_data:
+        await message.answer("❌ Неверный формат! Используйте ЧЧ:ММ (например, 08:30) или off")
+        return
+    formatted_time = f"{time_data[0]:02d}:{time_data[1]:02d}"
+    await db.set_digest(message.chat.id, formatted_time)
+    await message.answer(f"☀️ Сводка задач будет приходить каждый день в {formatted_time}")
+
 @router.message()
 async def handle_other_messages(message: types.Message):
     await message.answer("Я не понимаю эту команду. Используйте кнопки из меню.", reply_markup=create_main_keyboard())
\ No newline at end of file
@@ -0,0 +1,80 @@
+import csv
+import os
+import tempfile
+from datetime import datetime
+from aiogram import Bot, Router, flags, types, F
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.types import FSInputFile
+from database import Database
+from export import parse_import
+from keyboards import create_main_keyboard, get_cancel_inline_keyboard
+from states import DataStates
+
+router = Router()
+
+IMPORT_FILE_LIMIT = 5 * 1024 * 1024
+
+def admin_ids():
+    return {int(part) for part in os.getenv("ADMIN_IDS", "").replace(",", " ").split() if part.lstrip("-").isdigit()}
+
+@router.message(Command("export"))
+@flags.throttle("heavy")
+async def export_handler(message: types.Message, command: CommandObject, db: Database):
+    fmt = "csv" if (command.args or "").strip().lower() == "csv" else "json"
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        count = await db.export_user_data(message.chat.id, path, fmt)
+        await message.answer_document(
+            FSInputFile(path, filename=f"todo_export.{fmt}"),
+            caption=f"📦 Выгружено записей: {count}\nЗагрузить обратно: /import"
+        )
+    finally:
+        os.remove(path)
+
+@router.message(Command("import"))
+async def import_command(message: types.Message, state: FSMContext):
+    await message.answer(
+        "📥 Пришлите файл .json или .csv, полученный командой /export.\n"
+        "Записи из него добавятся к текущим.",
+        reply_markup=get_cancel_inline_keyboard()
+    )
+    await state.set_state(DataStates.waiting_for_import)
+
+@router.message(DataStates.waiting_for_import, F.document)
+@flags.throttle("heavy")
+async def handle_import_file(message: types.Message, state: FSMContext, db: Database, bot: Bot):
+    document = message.document
+    if not (document.file_name or "").lower().endswith(('.json', '.csv')):
+        await message.answer("❌ Нужен файл .json или .csv из /export")
+        return
+    if document.file_size and document.file_size > IMPORT_FILE_LIMIT:
+        await message.answer("❌ Файл слишком большой (максимум 5 МБ)")
+        return
+    content = await bot.download(document)
+    try:
+        tasks, reminders, schedule = parse_import(document.file_name, content.getvalue())
+    except (ValueError, TypeError, AttributeError, KeyError, csv.Error):
+        await message.answer("❌ Не удалось разобрать файл: это не выгрузка /export")
+        return
+    await db.import_user_data(message.chat.id, tasks, reminders, schedule)
+    await message.answer(
+        f"✅ Импортировано: задач {len(tasks)}, напоминаний {len(reminders)}, пунктов расписания {len(schedule)}",
+        reply_markup=create_main_keyboard()
+    )
+    await state.clear()
+
+@router.message(DataStates.waiting_for_import)
+async def handle_import_other(message: types.Message):
+    await message.answer("📎 Пришлите файл выгрузки или нажмите «Отмена»")
+
+@router.message(Command("backup"), F.from_user.id.func(lambda user_id: user_id in admin_ids()))
+async def backup_handler(message: types.Message, db: Database):
+    backup_dir = os.getenv("BACKUP_DIR", "backups")
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, f"todo_bot_{datetime.now():%Y%m%d_%H%M%S}.db")
+    await message.answer("💾 Резервная копия создаётся...")
+    pages = await db.backup(path)
+    size = os.path.getsize(path) / 1024 / 1024
+    await message.answer(f"💾 Готово: {path} ({pages} страниц, {size:.1f} МБ)")
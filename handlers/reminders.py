@@ -1,16 +1,13 @@
-import asyncio
-import logging
-import datetime
+from datetime import datetime
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from database import Database
 from states import TaskStates
 from utils import parse_time
-from keyboards import create_main_keyboard, get_cancel_inline_keyboard
+from keyboards import create_main_keyboard, get_cancel_inline_keyboard, reminder_repeat_keyboard
+from recurrence import DAYS, MAX_EVERY_MINUTES, describe_rule, next_fire, user_zone
 
 router = Router()
-db = Database()
-logger = logging.getLogger(__name__)
 
 @router.message(F.text == "⏰ Добавить напоминание")
 async def add_reminder_command(message: types.Message, state: FSMContext):
@@ -30,41 +27,42 @@ async def handle_reminder_time(message: types.Message, state: FSMContext):
         await message.answer("❌ Неверный формат!")
         return
     
-    data = await state.get_data()
     formatted_time = f"{time_data[0]:02d}:{time_data[1]:02d}"
-    db.add_reminder(message.chat.id, data['reminder_name'], formatted_time)
+    await state.update_data(reminder_time=formatted_time)
+    await message.answer("🔁 Как часто напоминать?", reply_markup=reminder_repeat_keyboard())
+    await state.set_state(TaskStates.waiting_for_reminder_repeat)
+
+async def save_reminder(message: types.Message, state: FSMContext, db: Database, rule: str):
+    data = await state.get_data()
+    name, formatted_time = data['reminder_name'], data['reminder_time']
+    await db.add_reminder(message.chat.id, name, formatted_time, rule)
     
-    await message.answer(f"⏰ Напоминание '{data['reminder_name']}' установлено на {formatted_time}", reply_markup=create_main_keyboard())
+    text = f"⏰ Напоминание '{name}' установлено на {formatted_time}"
+    if rule != "once":
+        text += f" ({describe_rule(rule)})"
+    await message.answer(text, reply_markup=create_main_keyboard())
     await state.clear()
 
-async def check_reminders(bot):
-    last_check_minute = -1
-
-    while True:
-        try:
-            now = datetime.datetime.now()
-            if now.minute == last_check_minute:
-                await asyncio.sleep(1)
-                continue
-            
-            last_check_minute = now.minute
-            current_time = now.strftime("%H:%M")
-            
-            reminders = db.get_due_reminders()
-            for reminder in reminders:
-                reminder_id, chat_id, name, time_str, is_sent = reminder
-                await bot.send_message(chat_id, f"⏰ Напоминание: {name}")
-                db.mark_reminder_sent(reminder_id)
-
-            days_map = {0: "Mon", 1: "Tue", 2: "Wed", 3: "Thu", 4: "Fri", 5: "Sat", 6: "Sun"}
-            current_day = days_map[now.weekday()]
+@router.callback_query(TaskStates.waiting_for_reminder_repeat, F.data.startswith("repeat_"))
+async def handle_reminder_repeat(callback: types.CallbackQuery, state: FSMContext, db: Database):
+    rule = callback.data.removeprefix("repeat_")
+    await callback.answer()
+    if rule == "every":
+        await callback.message.answer(f"⏱ Через сколько минут повторять? (от 1 до {MAX_EVERY_MINUTES})")
+        await state.set_state(TaskStates.waiting_for_reminder_interval)
+        return
+    if rule == "weekly":
+        data = await state.get_data()
+        zone = user_zone(await db.get_user_timezone(callback.message.chat.id))
+        local_now = datetime.now(zone).replace(tzinfo=None)
+        first = next_fire("daily", data['reminder_time'], local_now)
+        rule = f"weekly:{DAYS[first.weekday()]}"
+    await save_reminder(callback.message, state, db, rule)
 
-            schedule_items = db.get_schedule_for_now(current_day, current_time)
-            for user_id, text in schedule_items:
-                await bot.send_message(user_id, f"🗓 Расписание ({current_day}):\n🔔 {text}")
-            
-            await asyncio.sleep(1)
-            
-        except Exception as e:
-            logger.error(f"Error in check_reminders: {e}")
-            await asyncio.sleep(10)
\ No newline at end of file
+@router.message(TaskStates.waiting_for_reminder_interval)
+async def handle_reminder_interval(message: types.Message, state: FSMContext, db: Database):
+    text = (message.text or "").strip()
+    if not text.isdigit() or not 1 <= int(text) <= MAX_EVERY_MINUTES:
+        await message.answer(f"❌ Введите число минут от 1 до {MAX_EVERY_MINUTES}")
+        return
+    await save_reminder(message, state, db, f"every:{int(text)}")
@@ -1,22 +1,30 @@
 from aiogram import types, Router, F
 from aiogram.filters import Command
+from callbacks import ScheduleDayCallback
 from keyboards import schedule_inline_keyboard
 from states import ScheduleState
 from aiogram.fsm.context import FSMContext
 from database import Database
+from recurrence import DAYS
 from utils import parse_time
 
 router = Router()
-db = Database()
 
 @router.message(Command("schedule"))
 @router.message(F.text == "📜 Расписание")
 async def schedule_command(message: types.Message):
     await message.answer("Выберите день недели", reply_markup=schedule_inline_keyboard())
 
-@router.callback_query(F.data.endswith("_add"))
-async def process_day(callback: types.CallbackQuery, state: FSMContext):
-    day = callback.data.replace("_add", "")
+@router.callback_query(ScheduleDayCallback.filter(F.day.in_(DAYS)))
+async def process_day(callback: types.CallbackQuery, callback_data: ScheduleDayCallback, state: FSMContext):
+    await select_day(callback, state, callback_data.day)
+
+# Кнопки старого формата: Mon_add и т.д.
+@router.callback_query(F.data.in_({f"{day}_add" for day in DAYS}))
+async def legacy_process_day(callback: types.CallbackQuery, state: FSMContext):
+    await select_day(callback, state, callback.data.removesuffix("_add"))
+
+async def select_day(callback: types.CallbackQuery, state: FSMContext, day: str):
     await state.update_data(day=day)
     await callback.answer()
     await callback.message.answer("Введите время (например 15:30)")
@@ -37,14 +45,14 @@ async def process_time(message: types.Message, state: FSMContext):
     await state.set_state(ScheduleState.text)
 
 @router.message(ScheduleState.text)
-async def process_text(message: types.Message, state: FSMContext):
+async def process_text(message: types.Message, state: FSMContext, db: Database):
     data = await state.get_data()
     user_id = message.from_user.id
     day = data["day"]
     time = data["time"]
     text = message.text
 
-    db.add_schedule_item(user_id, day, time, text)
+    await db.add_schedule_item(user_id, day, time, text)
 
     await message.answer("Расписание сохранено 🗓️")
     await state.clear()
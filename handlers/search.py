@@ -0,0 +1,39 @@
+from aiogram import Router, flags, types
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from callbacks import SearchPageCallback
+from database import Database
+from keyboards import search_keyboard
+from utils import format_search_results
+
+router = Router()
+
+SEARCH_PAGE_SIZE = 10
+
+async def render_search_page(db: Database, chat_id: int, query: str, page: int = 0):
+    rows, total = await db.search(chat_id, query, SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
+    pages = max(1, -(-total // SEARCH_PAGE_SIZE))
+    text = format_search_results(query, rows, total, page, pages, page * SEARCH_PAGE_SIZE)
+    return text, search_keyboard(page, pages)
+
+@router.message(Command("find"))
+@flags.throttle("heavy")
+async def find_handler(message: types.Message, command: CommandObject, state: FSMContext, db: Database):
+    if not command.args:
+        await message.answer("🔍 Что искать? Например: /find молоко")
+        return
+    # Запрос не влезет в callback_data, поэтому для листания он хранится в FSM
+    await state.update_data(find_query=command.args)
+    text, keyboard = await render_search_page(db, message.chat.id, command.args)
+    await message.answer(text, reply_markup=keyboard)
+
+@router.callback_query(SearchPageCallback.filter())
+@flags.throttle("heavy")
+async def search_page_callback(callback: types.CallbackQuery, callback_data: SearchPageCallback, state: FSMContext, db: Database):
+    query = (await state.get_data()).get("find_query")
+    if not query:
+        await callback.answer("Поиск устарел, повторите /find")
+        return
+    text, keyboard = await render_search_page(db, callback.message.chat.id, query, callback_data.page)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
@@ -1,55 +1,171 @@
-from aiogram import Router, types, F
+import os
+from aiogram import Bot, Router, flags, types, F
 from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from database import Database
 from states import TaskStates
-from keyboards import create_main_keyboard, create_tasks_keyboard, get_cancel_inline_keyboard
-from utils import format_tasks_list
+from callbacks import (
+    NoopCallback, TaskCallback, TaskCallbackV1, TasksBulkCallback, TasksBulkCallbackV1,
+    TasksPageCallback, TasksPageCallbackV1,
+)
+from keyboards import create_main_keyboard, create_tasks_keyboard, done_task_button, get_cancel_inline_keyboard, replace_button
+from recurrence import user_zone
+from utils import format_history, format_tasks_list, parse_task_lines, parse_tasks_file
 
 router = Router()
-db = Database()
 
 @router.message(Command("add"))
 @router.message(F.text == "➕ Добавить задачу")
 async def add_task_command(message: types.Message, state: FSMContext):
-    await message.answer("📝 Введите текст новой задачи:", reply_markup=get_cancel_inline_keyboard())
+    await message.answer(
+        "📝 Введите текст новой задачи.\n"
+        "Несколько строк или файл .txt/.csv добавят по задаче на строку.",
+        reply_markup=get_cancel_inline_keyboard()
+    )
     await state.set_state(TaskStates.waiting_for_task)
 
+IMPORT_FILE_LIMIT = 1024 * 1024
+
+async def add_tasks_batch(message: types.Message, db: Database, texts):
+    max_batch = int(os.getenv("MAX_BATCH_TASKS", "1000"))
+    added = await db.add_tasks(message.chat.id, texts[:max_batch])
+    summary = f"✅ Добавлено задач: {added}"
+    if len(texts) > max_batch:
+        summary += f"\n⚠️ Пропущено {len(texts) - max_batch}: за раз можно добавить не больше {max_batch}"
+    await message.answer(summary, reply_markup=create_main_keyboard())
+
+@router.message(TaskStates.waiting_for_task, F.document)
+@flags.throttle("heavy")
+async def handle_tasks_file(message: types.Message, state: FSMContext, db: Database, bot: Bot):
+    document = message.document
+    if not (document.file_name or "").lower().endswith(('.txt', '.csv')):
+        await message.answer("❌ Поддерживаются только файлы .txt и .csv")
+        return
+    if document.file_size and document.file_size > IMPORT_FILE_LIMIT:
+        await message.answer("❌ Файл слишком большой (максимум 1 МБ)")
+        return
+    content = await bot.download(document)
+    texts = parse_tasks_file(document.file_name, content.getvalue())
+    if not texts:
+        await message.answer("❌ В файле не нашлось ни одной задачи")
+        return
+    await add_tasks_batch(message, db, texts)
+    await state.clear()
+
 @router.message(TaskStates.waiting_for_task)
-async def handle_task_input(message: types.Message, state: FSMContext):
-    text = message.text.strip()
-    if not text:
+async def handle_task_input(message: types.Message, state: FSMContext, db: Database):
+    texts = parse_task_lines(message.text or "")
+    if not texts:
         await message.answer("❌ Текст не может быть пустым!")
         return
-    db.add_task(message.chat.id, text)
-    await message.answer(f"✅ Задача добавлена: {text}", reply_markup=create_main_keyboard())
+    if len(texts) > 1:
+        await add_tasks_batch(message, db, texts)
+    else:
+        await db.add_task(message.chat.id, texts[0])
+        await message.answer(f"✅ Задача добавлена: {texts[0]}", reply_markup=create_main_keyboard())
     await state.clear()
 
+TASKS_PAGE_SIZE = 10
+
+async def render_tasks_page(db: Database, chat_id: int, cursor=None, page: int = 0):
+    tasks, prev_cursor, next_cursor, reminders, schedule = await db.get_list_view(chat_id, cursor, TASKS_PAGE_SIZE)
+    if cursor is not None and not tasks:
+        # Всё, что было дальше курсора, уже выполнено: возвращаемся в начало
+        tasks, prev_cursor, next_cursor, reminders, schedule = await db.get_list_view(chat_id, None, TASKS_PAGE_SIZE)
+    if prev_cursor is None:
+        page = 0
+    paged = bool(prev_cursor or next_cursor)
+    text = format_tasks_list(tasks, reminders, schedule, page, paged, page * TASKS_PAGE_SIZE)
+    return text, create_tasks_keyboard(tasks, page, prev_cursor, next_cursor), tasks
+
 @router.message(Command("list"))
 @router.message(F.text == "📋 Мои задачи")
-async def show_tasks_handler(message: types.Message):
-    user_id = message.chat.id
-    
-    tasks = db.get_tasks(user_id)
-    reminders = db.get_user_reminders(user_id)
-    schedule = db.get_full_schedule(user_id)
-
-    response_text = format_tasks_list(tasks, reminders, schedule)
+@flags.throttle("heavy")
+async def show_tasks_handler(message: types.Message, db: Database):
+    response_text, keyboard, _ = await render_tasks_page(db, message.chat.id)
     
     await message.answer(
         response_text, 
-        reply_markup=create_tasks_keyboard(tasks),
+        reply_markup=keyboard,
         parse_mode="Markdown"
     )
+
+@router.message(Command("history"))
+@flags.throttle("heavy")
+async def history_handler(message: types.Message, db: Database):
+    tasks, reminders = await db.get_history(message.chat.id)
+    tz = user_zone(await db.get_user_timezone(message.chat.id))
+    await message.answer(format_history(tasks, reminders, tz), parse_mode="Markdown")
+
+@router.callback_query(TasksPageCallback.filter())
+@flags.throttle("heavy")
+async def tasks_page_callback(callback: types.CallbackQuery, callback_data: TasksPageCallback, db: Database):
+    response_text, keyboard, _ = await render_tasks_page(db, callback.message.chat.id, callback_data.cursor, callback_data.page)
+    await callback.message.edit_text(response_text, reply_markup=keyboard, parse_mode="Markdown")
+    await callback.answer()
+
+@router.callback_query(NoopCallback.filter())
+async def tasks_noop_callback(callback: types.CallbackQuery):
+    await callback.answer()
+
+# V1-кнопки ещё несут номер страницы, который никто не читает
+@router.callback_query(TaskCallback.filter(F.action == "d"))
+@router.callback_query(TaskCallbackV1.filter(F.action == "d"))
+async def complete_task_callback(callback: types.CallbackQuery, callback_data: TaskCallback, db: Database):
+    text = await db.mark_task_done(callback_data.id, callback.message.chat.id)
+    if text is None:
+        await callback.answer("Задача уже выполнена")
+        return
+    # Меняем только строку с этой задачей, текст сообщения не пересобираем
+    markup = callback.message.reply_markup
+    if markup:
+        await callback.message.edit_reply_markup(
+            reply_markup=replace_button(markup, callback.data, done_task_button(text))
+        )
+    await callback.answer("Задача выполнена! ✅")
+
+@router.callback_query(TasksBulkCallback.filter(F.action == "a"))
+@router.callback_query(TasksBulkCallbackV1.filter(F.action == "a"))
+async def complete_all_callback(callback: types.CallbackQuery, db: Database):
+    updated = await db.mark_all_tasks_done(callback.message.chat.id)
+    if updated:
+        await callback.message.edit_text("🎉 Все задачи выполнены!")
+    await callback.answer(f"Выполнено задач: {updated}")
+
+@router.callback_query(TasksBulkCallback.filter(F.action == "x"))
+@router.callback_query(TasksBulkCallbackV1.filter(F.action == "x"))
+@flags.throttle("heavy")
+async def delete_done_callback(callback: types.CallbackQuery, db: Database):
+    deleted = await db.delete_done_tasks(callback.message.chat.id)
+    if deleted:
+        # Строки ☑️ удалённых задач остались в клавиатуре: пересобираем список
+        response_text, keyboard, _ = await render_tasks_page(db, callback.message.chat.id)
+        await callback.message.edit_text(response_text, reply_markup=keyboard, parse_mode="Markdown")
+    await callback.answer(f"Удалено выполненных задач: {deleted}")
+
+# Кнопки сообщений, отправленных до перехода на CallbackData и на курсоры.
+# Номер страницы без курсора больше ничего не адресует: открываем первую.
+
+@router.callback_query(TasksPageCallbackV1.filter())
+@router.callback_query(F.data.startswith('tasks_page_'))
+@flags.throttle("heavy")
+async def legacy_tasks_page_callback(callback: types.CallbackQuery, db: Database):
+    response_text, keyboard, _ = await render_tasks_page(db, callback.message.chat.id)
+    await callback.message.edit_text(response_text, reply_markup=keyboard, parse_mode="Markdown")
+    await callback.answer()
+
+@router.callback_query(F.data == 'tasks_noop')
+async def legacy_tasks_noop_callback(callback: types.CallbackQuery):
+    await callback.answer()
+
 @router.callback_query(F.data.startswith('complete_'))
-async def complete_task_callback(callback: types.CallbackQuery):
+async def legacy_complete_task_callback(callback: types.CallbackQuery, db: Database):
     task_id = int(callback.data.split('_')[1])
-    db.mark_task_done(task_id, callback.message.chat.id)
-    tasks = db.get_tasks(callback.message.chat.id)
+    await db.mark_task_done(task_id, callback.message.chat.id)
+    response_text, keyboard, tasks = await render_tasks_page(db, callback.message.chat.id)
     
     if not tasks:
         await callback.message.edit_text("🎉 Все задачи выполнены!")
     else:
-        reminders = db.get_user_reminders(callback.message.chat.id)
-        await callback.message.edit_text(format_tasks_list(tasks, reminders), reply_markup=create_tasks_keyboard(tasks))
-    await callback.answer("Задача выполнена! ✅")
\ No newline at end of file
+        await callback.message.edit_text(response_text, reply_markup=keyboard, parse_mode="Markdown")
+    await callback.answer("Задача выполнена! ✅")
@@ -6,6 +6,8 @@ from aiogram.types import (
     InlineKeyboardButton
 )
 
+from callbacks import NoopCallback, ScheduleDayCallback, SearchPageCallback, TaskCallback, TasksBulkCallback, TasksPageCallback
+
 def create_main_keyboard():
     keyboard = [
         [KeyboardButton(text="📋 Мои задачи"), KeyboardButton(text="➕ Добавить задачу")],
@@ -13,19 +15,58 @@ def create_main_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
-def create_tasks_keyboard(tasks):   
+def task_button(task_id, text):
+    return InlineKeyboardButton(
+        text=f"✅ {text[:25]}..", 
+        callback_data=TaskCallback(action="d", id=task_id).pack()
+    )
+
+def done_task_button(text):
+    return InlineKeyboardButton(text=f"☑️ {text[:25]}..", callback_data=NoopCallback().pack())
+
+def create_tasks_keyboard(tasks, page=0, prev_cursor=None, next_cursor=None):
     keyboard = []
     for task in tasks:
         task_id, text, is_done = task
         if not is_done:
-            keyboard.append([
-                InlineKeyboardButton(
-                    text=f"✅ {text[:25]}..", 
-                    callback_data=f"complete_{task_id}"
-                )
-            ])
+            keyboard.append([task_button(task_id, text)])
+    if prev_cursor or next_cursor:
+        navigation = []
+        if prev_cursor:
+            navigation.append(InlineKeyboardButton(
+                text="◀️", callback_data=TasksPageCallback.for_cursor(page - 1, "p", prev_cursor).pack()
+            ))
+        navigation.append(InlineKeyboardButton(text=f"стр. {page + 1}", callback_data=NoopCallback().pack()))
+        if next_cursor:
+            navigation.append(InlineKeyboardButton(
+                text="▶️", callback_data=TasksPageCallback.for_cursor(page + 1, "n", next_cursor).pack()
+            ))
+        keyboard.append(navigation)
+    if keyboard:
+        keyboard.append([
+            InlineKeyboardButton(text="✅ Выполнить все", callback_data=TasksBulkCallback(action="a").pack()),
+            InlineKeyboardButton(text="🗑 Удалить выполненные", callback_data=TasksBulkCallback(action="x").pack()),
+        ])
     return InlineKeyboardMarkup(inline_keyboard=keyboard) if keyboard else None
 
+def search_keyboard(page, pages):
+    if pages <= 1:
+        return None
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="◀️", callback_data=SearchPageCallback(page=page - 1).pack()))
+    navigation.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data=NoopCallback().pack()))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton(text="▶️", callback_data=SearchPageCallback(page=page + 1).pack()))
+    return InlineKeyboardMarkup(inline_keyboard=[navigation])
+
+def replace_button(markup, callback_data, button):
+    """Копия клавиатуры, в которой кнопка с callback_data заменена на button"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [button if b.callback_data == callback_data else b for b in row]
+        for row in markup.inline_keyboard
+    ])
+
 def get_cancel_inline_keyboard():
     keyboard = [
         [
@@ -34,11 +75,22 @@ def get_cancel_inline_keyboard():
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+def reminder_repeat_keyboard():
+    keyboard = [
+        [InlineKeyboardButton(text="Один раз", callback_data="repeat_once"), InlineKeyboardButton(text="Ежедневно", callback_data="repeat_daily")],
+        [InlineKeyboardButton(text="По будням", callback_data="repeat_weekdays"), InlineKeyboardButton(text="Раз в неделю", callback_data="repeat_weekly")],
+        [InlineKeyboardButton(text="⏱ Каждые N минут", callback_data="repeat_every")],
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 def schedule_inline_keyboard():
+    def day(text, code):
+        return InlineKeyboardButton(text=text, callback_data=ScheduleDayCallback(day=code).pack())
+
     keyboard = [
-            [InlineKeyboardButton(text="Пн", callback_data="Mon_add"), InlineKeyboardButton(text="Вт", callback_data="Tue_add"), InlineKeyboardButton(text="Ср", callback_data="Wed_add")],
-            [InlineKeyboardButton(text="Чт", callback_data="Thu_add"), InlineKeyboardButton(text="Пт", callback_data="Fri_add")],
-            [InlineKeyboardButton(text="Сб", callback_data="Sat_add"), InlineKeyboardButton(text="Вс", callback_data="Sun_add")]
+            [day("Пн", "Mon"), day("Вт", "Tue"), day("Ср", "Wed")],
+            [day("Чт", "Thu"), day("Пт", "Fri")],
+            [day("Сб", "Sat"), day("Вс", "Sun")]
         ]
 
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -1,13 +1,22 @@
 import asyncio
 import logging
 import os
+import secrets
+import time
+from datetime import timedelta
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 
 from handlers import get_handlers_router 
-from handlers.reminders import check_reminders
+from middlewares import setup_throttling
 from database import Database
+from fsm_storage import SQLiteStorage
+from scheduler import ReminderScheduler, SchedulerLeader
+from delivery import DeliveryQueue
+from metrics import start_metrics_server
+from retention import RetentionJob
+from webhook import create_forwarding_app, create_webhook_app, run_webhook
+from workers import WorkerPool, poll_updates
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -23,42 +32,96 @@ async def run_bot():
         logger.error("BOT_TOKEN не найден!")
         return
 
+    started = time.perf_counter()
     bot = Bot(token=token)
-    storage = MemoryStorage()
-    
     db = Database()
-    db.init_db()
+    schema_version = await db.init_db()
+    logger.info(f"Схема БД: версия {schema_version}")
+    storage = SQLiteStorage(db)
+
+    dp = Dispatcher(storage=storage, db=db)
+    dp.include_router(get_handlers_router())
+    setup_throttling(dp)
+
+    delivery = DeliveryQueue(bot, db)
+    await delivery.start()
+    scheduler = ReminderScheduler(db, delivery)
+    leader_task = asyncio.create_task(SchedulerLeader(scheduler, db).run())
+    retention = RetentionJob(
+        db,
+        max_age=timedelta(days=int(os.getenv('RETENTION_DAYS', '30'))),
+        keep=os.getenv('RETENTION_MODE', 'archive') != 'delete',
+    )
+    retention_task = asyncio.create_task(retention.run())
+
+    metrics_runner = None
+    metrics_port = os.getenv('METRICS_PORT')
+    if metrics_port:
+        metrics_runner = await start_metrics_server(os.getenv('METRICS_HOST', '127.0.0.1'), int(metrics_port))
+
+    pool = None
+    workers = int(os.getenv('BOT_WORKERS', '1'))
+    if workers > 1:
+        pool = WorkerPool(token, workers)
+        pool.start()
+        events_task = asyncio.create_task(pool.forward_events(scheduler.notify))
+    allowed_updates = dp.resolve_used_update_types()
+    logger.info(f"Инициализация заняла {time.perf_counter() - started:.3f} с")
+
+    webhook_url = os.getenv('WEBHOOK_URL')
+    webhook_secret = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
 
     max_retries = 10
     retry_delay = 5
-    
-    for attempt in range(max_retries):
-        try:
-            dp = Dispatcher(storage=storage)
-            dp.include_router(get_handlers_router())
-            
-            asyncio.create_task(check_reminders(bot))
-            
-            logger.info(f"Запуск бота (попытка {attempt + 1}/{max_retries})...")
-            
-            await bot.delete_webhook(drop_pending_updates=True)
-            await dp.start_polling(bot)
+
+    try:
+        for attempt in range(max_retries):
+            try:
+                logger.info(f"Запуск бота (попытка {attempt + 1}/{max_retries})...")
             
-        except Exception as e:
-            logger.error(f"Ошибка в работе бота: {e}")
-            current_delay = min(retry_delay * (2 ** attempt), 300)
-            logger.info(f"Перезапуск через {current_delay} секунд...")
+                if webhook_url:
+                    path = os.getenv('WEBHOOK_PATH', '/webhook')
+                    if pool:
+                        app = create_forwarding_app(pool.dispatch, webhook_secret, path)
+                    else:
+                        app = create_webhook_app(dp, bot, webhook_secret, path)
+                    await run_webhook(
+                        app, bot, webhook_url, webhook_secret, allowed_updates,
+                        host=os.getenv('WEBAPP_HOST', '0.0.0.0'),
+                        port=int(os.getenv('WEBAPP_PORT', '8080')),
+                        path=path,
+                    )
+                elif pool:
+                    await bot.delete_webhook(drop_pending_updates=False)
+                    await poll_updates(bot, pool.dispatch, allowed_updates)
+                else:
+                    await bot.delete_webhook(drop_pending_updates=False)
+                    await dp.start_polling(bot, allowed_updates=allowed_updates)
             
-            await bot.session.close()
-            await asyncio.sleep(current_delay)
+            except Exception as e:
+                logger.error(f"Ошибка в работе бота: {e}")
+                current_delay = min(retry_delay * (2 ** attempt), 300)
+                logger.info(f"Перезапуск через {current_delay} секунд...")
             
-            bot = Bot(token=token)
+                await bot.session.close()
+                await asyncio.sleep(current_delay)
+            else:
+                break
         else:
-            break
-    else:
-        logger.error(f"Бот не смог запуститься после {max_retries} попыток")
-    
-    await bot.session.close()
+            logger.error(f"Бот не смог запуститься после {max_retries} попыток")
+    finally:
+        leader_task.cancel()
+        retention_task.cancel()
+        await asyncio.gather(leader_task, retention_task, return_exceptions=True)
+        if pool:
+            await pool.stop()
+            await asyncio.gather(events_task, return_exceptions=True)
+        await delivery.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await storage.close()
+        await bot.session.close()
+        await db.close()
 
 async def main():
     print("Бот запущен! Нажмите Ctrl+C для остановки")
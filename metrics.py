@@ -0,0 +1,177 @@
+import logging
+from bisect import bisect_left
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Метрики в текстовом формате Prometheus. Запись на горячем пути - это
+# поиск дочерней серии в словаре и пара сложений, без блокировок:
+# всё пишется из цикла событий.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._child()
+        registry.register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._child()
+        return child
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield from child.samples(self.name, _format_labels(self.labelnames, values))
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Значение считается при каждом чтении /metrics"""
+        self.function = function
+
+    def samples(self, name, labels):
+        value = self.function() if self.function else self.value
+        yield f"{name}{labels} {value}"
+
+class Counter(_Metric):
+    kind = "counter"
+    _child = _Value
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _child = _Value
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def set_function(self, function):
+        self._children[()].set_function(function)
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        inner = labels[1:-1]
+        prefix = inner + "," if inner else ""
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield f'{name}_bucket{{{prefix}le="{le}"}} {total}'
+        yield f"{name}_sum{labels} {self.sum}"
+        yield f"{name}_count{labels} {total}"
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labelnames, registry)
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+    def totals(self):
+        """(число наблюдений, сумма) по всем сериям"""
+        children = self._children.values()
+        return sum(sum(child.counts) for child in children), sum(child.sum for child in children)
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время обработки апдейта хендлером", ("router", "event"))
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в хендлерах", ("router", "event"))
+THROTTLED_UPDATES = Counter(
+    "bot_throttled_updates_total", "Апдейты, отброшенные по лимиту частоты", ("limit",))
+DB_QUERY_SECONDS = Histogram(
+    "bot_db_query_seconds", "Время запроса к SQLite вместе с ожиданием своего потока", ("method", "mode"))
+LIST_CACHE_REQUESTS = Counter(
+    "bot_list_cache_requests_total", "Обращения к кэшу списка дел", ("result",))
+SCHEDULER_TICK_SECONDS = Histogram(
+    "bot_scheduler_tick_seconds", "Длительность тика планировщика")
+SCHEDULER_LAG_SECONDS = Histogram(
+    "bot_scheduler_lag_seconds", "Опоздание тика относительно срока срабатывания",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 30, 60, 300, 3600))
+DELIVERY_QUEUE_DEPTH = Gauge(
+    "bot_delivery_queue_depth", "Уведомлений в памяти очереди доставки")
+OUTBOX_PENDING = Gauge(
+    "bot_outbox_pending", "Записей outbox, ожидающих отправки")
+DELIVERY_MESSAGES = Counter(
+    "bot_delivery_messages_total", "Итог доставки уведомлений", ("result",))
+DELIVERY_MERGED = Counter(
+    "bot_delivery_merged_total", "Уведомления, дописанные в уже ожидающее сообщение того же чата")
+TELEGRAM_ERRORS = Counter(
+    "bot_telegram_errors_total", "Ошибки Telegram API при отправке", ("error",))
+TELEGRAM_RETRIES = Counter(
+    "bot_telegram_retries_total", "Повторные попытки отправки")
+
+async def start_metrics_server(host="127.0.0.1", port=9100, registry=REGISTRY):
+    """Поднимает /metrics на отдельном порту, возвращает AppRunner для остановки"""
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,103 @@
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message
+
+from cache import TTLCache
+from metrics import HANDLER_ERRORS, HANDLER_SECONDS, THROTTLED_UPDATES
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Замеряет время хендлеров роутера; вешается как inner-middleware,
+    поэтому считает только апдейты, для которых хендлер нашёлся"""
+
+    def __init__(self, router_name, event_type):
+        self.latency = HANDLER_SECONDS.labels(router_name, event_type)
+        self.errors = HANDLER_ERRORS.labels(router_name, event_type)
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.inc()
+            raise
+        finally:
+            self.latency.observe(time.perf_counter() - started)
+
+def instrument_router(router, name):
+    router.message.middleware(HandlerMetricsMiddleware(name, "message"))
+    router.callback_query.middleware(HandlerMetricsMiddleware(name, "callback_query"))
+
+class ChatRateLimiter:
+    """Token bucket на чат в виде GCRA: на ключ хранится одно число -
+    момент, к которому ведро снова станет полным. Ключи живут в dict
+    в порядке последнего обращения; при переполнении выбрасываются самые
+    давние, что равносильно полному ведру."""
+
+    def __init__(self, rate, burst, maxsize=100000):
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * (burst - 1)
+        self.maxsize = maxsize
+        self._tat = {}
+
+    def allow(self, key):
+        now = time.monotonic()
+        tat = max(self._tat.pop(key, now), now)
+        if tat - now > self.tolerance:
+            self._tat[key] = tat
+            return False
+        self._tat[key] = tat + self.interval
+        if len(self._tat) > self.maxsize:
+            del self._tat[next(iter(self._tat))]
+        return True
+
+    def __len__(self):
+        return len(self._tat)
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Отбрасывает апдейты чата сверх лимита.
+
+    Как outer-middleware ограничивает все апдейты чата ещё до фильтров
+    (лимит default). Как inner-middleware применяет именованные лимиты
+    к хендлерам с флагом throttle, например flags={"throttle": "heavy"}.
+    Об отказе пользователь узнаёт один раз за warn_interval; на callback
+    всегда отвечаем, чтобы у кнопки не висели часики.
+    """
+
+    def __init__(self, limits, warn_interval=10):
+        self.limiters = {name: ChatRateLimiter(rate, burst) for name, (rate, burst) in limits.items()}
+        self._warned = TTLCache(maxsize=10000, ttl=warn_interval)
+        self.rejected = 0
+
+    async def __call__(self, handler, event, data):
+        name = get_flag(data, "throttle", default="default")
+        limiter = self.limiters.get(name)
+        chat = data.get("event_chat")
+        if limiter is None or chat is None or limiter.allow(chat.id):
+            return await handler(event, data)
+
+        self.rejected += 1
+        THROTTLED_UPDATES.labels(name).inc()
+        warn = self._warned.get((name, chat.id)) is None
+        if warn:
+            self._warned.set((name, chat.id), True)
+        if isinstance(event, CallbackQuery):
+            await event.answer("⏳ Слишком часто, подождите немного" if warn else None)
+        elif isinstance(event, Message) and warn:
+            await event.answer("⏳ Слишком много сообщений, подождите немного")
+
+THROTTLE_LIMITS = {
+    # Обычные апдейты: в среднем 1 в секунду, до 10 подряд
+    "default": (1.0, 10),
+    # Списки, поиск, импорт файлов: одна отрисовка в 2 секунды, до 3 подряд
+    "heavy": (0.5, 3),
+}
+
+def setup_throttling(dp, limits=THROTTLE_LIMITS):
+    outer = ThrottlingMiddleware({"default": limits["default"]})
+    inner = ThrottlingMiddleware({name: limit for name, limit in limits.items() if name != "default"})
+    for observer in (dp.message, dp.callback_query):
+        observer.outer_middleware(outer)
+        observer.middleware(inner)
+    return outer, inner
@@ -0,0 +1,260 @@
+import logging
+from datetime import datetime, timezone
+
+from recurrence import DAYS, next_fire
+
+logger = logging.getLogger(__name__)
+
+def fill_schedule_next_fire(conn):
+    now = datetime.now()
+    rows = conn.execute('SELECT id, day, time FROM schedule').fetchall()
+    conn.executemany(
+        'UPDATE schedule SET next_fire_at = ? WHERE id = ?',
+        [(next_fire(f"weekly:{day}", time_str, now), row_id) for row_id, day, time_str in rows if day in DAYS]
+    )
+
+def convert_times_to_utc(conn):
+    # До версии 7 время хранилось в локальной зоне сервера
+    def to_utc(value):
+        return datetime.fromisoformat(value).astimezone(timezone.utc).replace(tzinfo=None)
+
+    for table, column in (("reminders", "reminder_datetime"), ("schedule", "next_fire_at")):
+        rows = conn.execute(f'SELECT id, {column} FROM {table} WHERE {column} IS NOT NULL').fetchall()
+        conn.executemany(f'UPDATE {table} SET {column} = ? WHERE id = ?', [(to_utc(value), row_id) for row_id, value in rows])
+
+# Каждый шаг применяется ровно один раз и в своей транзакции.
+# Новые шаги добавляются только в конец списка, старые не редактируются.
+MIGRATIONS = [
+    (1, "базовая схема", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            chat_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            text TEXT NOT NULL,
+            is_done BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (chat_id) REFERENCES users (chat_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            name TEXT NOT NULL,
+            time TEXT NOT NULL,
+            reminder_datetime TIMESTAMP,
+            is_sent BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (chat_id) REFERENCES users (chat_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS schedule (
+            user_id INTEGER,
+            day TEXT,
+            time TEXT,
+            text TEXT
+        )
+        ''',
+    ]),
+    (2, "первичный ключ в schedule", [
+        '''
+        CREATE TABLE schedule_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            day TEXT,
+            time TEXT,
+            text TEXT
+        )
+        ''',
+        'INSERT INTO schedule_new (user_id, day, time, text) SELECT user_id, day, time, text FROM schedule',
+        'DROP TABLE schedule',
+        'ALTER TABLE schedule_new RENAME TO schedule',
+    ]),
+    (3, "индексы для выборок по времени и по пользователю", [
+        'CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (is_sent, reminder_datetime)',
+        'CREATE INDEX IF NOT EXISTS idx_reminders_chat ON reminders (chat_id, time)',
+        'CREATE INDEX IF NOT EXISTS idx_schedule_slot ON schedule (day, time)',
+        'CREATE INDEX IF NOT EXISTS idx_schedule_user ON schedule (user_id, day, time)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_chat ON tasks (chat_id, is_done, created_at)',
+    ]),
+    (4, "хранилище состояний FSM", [
+        '''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)',
+    ]),
+    (5, "аренды для выбора лидера среди процессов", [
+        '''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        ''',
+    ]),
+    (6, "правила повторения и предвычисленное время срабатывания", [
+        "ALTER TABLE reminders ADD COLUMN rule TEXT NOT NULL DEFAULT 'once'",
+        'ALTER TABLE schedule ADD COLUMN next_fire_at TIMESTAMP',
+        fill_schedule_next_fire,
+        'DROP INDEX IF EXISTS idx_schedule_slot',
+        'CREATE INDEX IF NOT EXISTS idx_schedule_due ON schedule (next_fire_at)',
+    ]),
+    (7, "часовой пояс пользователя, время в UTC", [
+        'ALTER TABLE users ADD COLUMN tz TEXT',
+        convert_times_to_utc,
+    ]),
+    (8, "outbox исходящих уведомлений и состояние планировщика", [
+        '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            fire_at TIMESTAMP NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state, fire_at)',
+        '''
+        CREATE TABLE IF NOT EXISTS scheduler_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        ''',
+    ]),
+    (9, "архив выполненных задач и отправленных напоминаний", [
+        'ALTER TABLE tasks ADD COLUMN done_at TIMESTAMP',
+        'UPDATE tasks SET done_at = created_at WHERE is_done = TRUE',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_done ON tasks (is_done, done_at)',
+        '''
+        CREATE TABLE IF NOT EXISTS tasks_archive (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER,
+            text TEXT NOT NULL,
+            created_at TIMESTAMP,
+            done_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_archive_chat ON tasks_archive (chat_id, done_at)',
+        '''
+        CREATE TABLE IF NOT EXISTS reminders_archive (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER,
+            name TEXT NOT NULL,
+            time TEXT NOT NULL,
+            rule TEXT,
+            reminder_datetime TIMESTAMP,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_reminders_archive_chat ON reminders_archive (chat_id, reminder_datetime)',
+    ]),
+    (10, "полнотекстовый поиск FTS5", [
+        # rowid = id * 4 + вид (1 - задача, 2 - напоминание, 3 - расписание).
+        # Владелец - отдельная индексируемая колонка, чтобы запрос сразу
+        # пересекал список документов пользователя со списком слов.
+        # unicode61 не сводит ё к е, поэтому это делается при записи.
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            body, owner, kind UNINDEXED, item_id UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        ''',
+        *[
+            sql
+            for table, code, kind, column, owner in (
+                ("tasks", 1, "task", "text", "chat_id"),
+                ("reminders", 2, "reminder", "name", "chat_id"),
+                ("schedule", 3, "schedule", "text", "user_id"),
+            )
+            for sql in (
+                f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO search_index (rowid, body, owner, kind, item_id)
+                    VALUES (new.id * 4 + {code}, replace(replace(new.{column}, 'ё', 'е'), 'Ё', 'Е'), 'u' || new.{owner}, '{kind}', new.id);
+                END
+                ''',
+                f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+                    DELETE FROM search_index WHERE rowid = old.id * 4 + {code};
+                END
+                ''',
+                f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {column}, {owner} ON {table} BEGIN
+                    DELETE FROM search_index WHERE rowid = old.id * 4 + {code};
+                    INSERT INTO search_index (rowid, body, owner, kind, item_id)
+                    VALUES (new.id * 4 + {code}, replace(replace(new.{column}, 'ё', 'е'), 'Ё', 'Е'), 'u' || new.{owner}, '{kind}', new.id);
+                END
+                ''',
+                f'''
+                INSERT INTO search_index (rowid, body, owner, kind, item_id)
+                SELECT id * 4 + {code}, replace(replace({column}, 'ё', 'е'), 'Ё', 'Е'), 'u' || {owner}, '{kind}', id FROM {table}
+                ''',
+            )
+        ],
+    ]),
+    (11, "утренняя сводка и разметка сообщений outbox", [
+        'ALTER TABLE users ADD COLUMN digest_time TEXT',
+        'ALTER TABLE users ADD COLUMN digest_next_at TIMESTAMP',
+        'CREATE INDEX IF NOT EXISTS idx_users_digest ON users (digest_next_at)',
+        'ALTER TABLE outbox ADD COLUMN parse_mode TEXT',
+    ]),
+    (12, "кто и когда взял запись outbox в отправку", [
+        'ALTER TABLE outbox ADD COLUMN claimed_by TEXT',
+        'ALTER TABLE outbox ADD COLUMN claimed_at REAL',
+    ]),
+    (13, "индексы истории по пользователю", [
+        'CREATE INDEX IF NOT EXISTS idx_tasks_chat_done ON tasks (chat_id, is_done, done_at)',
+        'CREATE INDEX IF NOT EXISTS idx_reminders_chat_sent ON reminders (chat_id, is_sent, reminder_datetime)',
+    ]),
+]
+
+def get_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def migrate(conn):
+    """Применяет недостающие шаги миграций, возвращает итоговую версию схемы"""
+    current = get_version(conn)
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute('BEGIN')
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)', (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"Миграция {version} применена: {description}")
+        current = version
+    return current
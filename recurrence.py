@@ -0,0 +1,114 @@
+import os
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+MAX_EVERY_MINUTES = 1440
+
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+DAY_NAMES = {
+    "Mon": "понедельникам", "Tue": "вторникам", "Wed": "средам", "Thu": "четвергам",
+    "Fri": "пятницам", "Sat": "субботам", "Sun": "воскресеньям",
+}
+
+# Правила повторения хранятся строкой:
+#   once        - один раз
+#   daily       - каждый день в ЧЧ:ММ
+#   weekdays    - по будням в ЧЧ:ММ
+#   weekly:Mon  - раз в неделю в указанный день в ЧЧ:ММ
+#   every:30    - каждые N минут (от 1 до 1440), начиная с ЧЧ:ММ в день
+#                 создания или на следующий, если это время уже прошло
+
+# Все моменты времени в базе хранятся как наивные datetime в UTC,
+# а ЧЧ:ММ в правилах - это местное время пользователя.
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def default_timezone():
+    return os.getenv("DEFAULT_TZ", "Europe/Moscow")
+
+def parse_timezone(name):
+    """ZoneInfo по имени (Europe/Moscow) или смещению (+3, UTC-5); None, если не распознано"""
+    name = name.strip()
+    offset = name.upper().removeprefix("UTC").removeprefix("GMT")
+    if offset[:1] in ("+", "-") and offset[1:].isdigit() and int(offset[1:]) <= 14:
+        # В базе IANA знак у Etc/GMT обратный: UTC+3 - это Etc/GMT-3
+        hours = int(offset[1:])
+        name = "Etc/UTC" if hours == 0 else f"Etc/GMT{'-' if offset[0] == '+' else '+'}{hours}"
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+def user_zone(name):
+    return (name and parse_timezone(name)) or parse_timezone(default_timezone()) or timezone.utc
+
+def is_valid_rule(rule):
+    if rule in ("once", "daily", "weekdays"):
+        return True
+    kind, _, arg = rule.partition(":")
+    if kind == "weekly":
+        return arg in DAYS
+    if kind == "every":
+        return arg.isdigit() and 1 <= int(arg) <= MAX_EVERY_MINUTES
+    return False
+
+def _to_local(moment, tz):
+    return moment.replace(tzinfo=timezone.utc).astimezone(tz).replace(tzinfo=None)
+
+def next_fire(rule, time_str, after, tz=timezone.utc, since=None):
+    """Ближайший момент срабатывания строго после after (оба в UTC) для пользователя из зоны tz.
+
+    since - момент создания записи в UTC, от него отсчитывается every:N;
+    по умолчанию запись считается созданной в after.
+    """
+    local_after = _to_local(after, tz)
+    local_since = _to_local(since or after, tz)
+    while True:
+        local = _next_local(rule, time_str, local_after, local_since)
+        fire_at = local.replace(tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+        # При переводе часов назад местное время повторяется: ищем дальше
+        if fire_at > after:
+            return fire_at
+        local_after = local
+
+def _next_local(rule, time_str, after, since):
+    hour, minute = map(int, time_str.split(':'))
+    base = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    kind, _, arg = rule.partition(":")
+
+    if kind == "every":
+        # Шаги идут от первого ЧЧ:ММ после создания, а не от сегодняшнего,
+        # чтобы фаза не сбрасывалась в полночь
+        start = since.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if start <= since:
+            start += timedelta(days=1)
+        if after < start:
+            return start
+        step = timedelta(minutes=int(arg))
+        return start + step * ((after - start) // step + 1)
+
+    if kind == "weekly":
+        candidate = base + timedelta(days=(DAYS.index(arg) - after.weekday()) % 7)
+        if candidate <= after:
+            candidate += timedelta(days=7)
+        return candidate
+
+    candidate = base if base > after else base + timedelta(days=1)
+    if kind == "weekdays":
+        while candidate.weekday() >= 5:
+            candidate += timedelta(days=1)
+    return candidate
+
+def describe_rule(rule):
+    kind, _, arg = rule.partition(":")
+    if kind == "daily":
+        return "ежедневно"
+    if kind == "weekdays":
+        return "по будням"
+    if kind == "weekly":
+        return f"по {DAY_NAMES[arg]}"
+    if kind == "every":
+        return f"каждые {arg} мин"
+    return "один раз"
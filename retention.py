@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from recurrence import utc_now
+
+logger = logging.getLogger(__name__)
+
+class RetentionJob:
+    """Фоновая чистка горячих таблиц.
+
+    Выполненные задачи и отправленные напоминания старше max_age переносятся
+    в архивные таблицы (или удаляются, если keep=False), отработанные записи
+    outbox удаляются. Всё идёт мелкими транзакциями с паузой между ними,
+    чтобы поток-писатель успевал обслуживать хендлеры. Освободившиеся
+    страницы возвращаются через incremental_vacuum.
+    """
+
+    def __init__(self, db, max_age=timedelta(days=30), keep=True, batch_size=500,
+                 pause=0.05, interval=3600, vacuum_pages=1000):
+        self.db = db
+        self.max_age = max_age
+        self.keep = keep
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка при архивации: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        before = utc_now() - self.max_age
+        tasks = await self._drain(lambda: self.db.archive_tasks(before, self.batch_size, self.keep))
+        reminders = await self._drain(lambda: self.db.archive_reminders(before, self.batch_size, self.keep))
+        outbox = await self._drain(lambda: self.db.purge_outbox(before, self.batch_size))
+        free = await self.db.incremental_vacuum(self.vacuum_pages)
+        if tasks or reminders or outbox:
+            action = "в архив" if self.keep else "удалено"
+            logger.info(f"Архивация: задач {tasks}, напоминаний {reminders} {action}, "
+                        f"записей outbox удалено {outbox}, свободных страниц {free}")
+        return tasks, reminders, outbox
+
+    async def _drain(self, step):
+        total = 0
+        while True:
+            count = await step()
+            total += count
+            if count < self.batch_size:
+                return total
+            await asyncio.sleep(self.pause)
@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from metrics import SCHEDULER_LAG_SECONDS, SCHEDULER_TICK_SECONDS
+from recurrence import utc_now
+from utils import format_tasks_list
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница сна: раз в час сверяемся с настенными часами,
+# чтобы перевод системного времени не сдвинул срабатывания
+MAX_SLEEP = 3600
+
+REMINDER_TEXT = "⏰ Напоминание: {name}"
+SCHEDULE_TEXT = "🗓 Расписание ({day}):\n🔔 {text}"
+DIGEST_TITLE = "☀️ **Доброе утро!** Открытых задач: {total}"
+
+class ReminderScheduler:
+    """Таймер на min-куче: спит ровно до ближайшего срабатывания.
+
+    Время следующего срабатывания предвычислено в базе (reminder_datetime
+    у напоминаний, next_fire_at у расписания), поэтому в куче достаточно
+    держать ближайшие сроки, а на срабатывании выполнить индексный запрос
+    по диапазону. Database сообщает об изменениях через notify, и таймер
+    перевзводится без опроса базы.
+
+    Сам планировщик ничего не отправляет: наступившие срабатывания он
+    переносит в outbox, откуда их забирает очередь доставки. Всё, что
+    наступило, пока бот лежал, попадает в outbox на первом же тике.
+    """
+
+    def __init__(self, db, delivery):
+        self.db = db
+        self.delivery = delivery
+        self._heap = []
+        self._queued = set()
+        self._wakeup = asyncio.Event()
+        self.running = False
+        db.subscribe(self.notify)
+
+    def _push(self, fire_at, kind):
+        entry = (fire_at, kind)
+        if fire_at is None or entry in self._queued:
+            return
+        self._queued.add(entry)
+        heapq.heappush(self._heap, entry)
+
+    def notify(self, event, payload=None):
+        # В процессе без аренды куча не нужна: её заполнит _load при старте
+        if not self.running:
+            return
+        if event in ("reminder", "schedule", "digest"):
+            self._push(payload, event)
+        self._wakeup.set()
+
+    async def _load(self):
+        self._push(await self.db.get_next_reminder_time(), "reminder")
+        self._push(await self.db.get_next_schedule_time(), "schedule")
+        self._push(await self.db.get_next_digest_time(), "digest")
+
+    async def reload(self):
+        await self._load()
+        self._wakeup.set()
+
+    async def run(self):
+        self._heap = []
+        self._queued = set()
+        self.running = True
+        try:
+            await self._run()
+        finally:
+            self.running = False
+            self._heap = []
+            self._queued = set()
+
+    async def _run(self):
+        last_tick = await self.db.get_last_tick()
+        if last_tick is not None and utc_now() - last_tick > timedelta(minutes=1):
+            logger.warning(f"Планировщик не работал с {last_tick:%Y-%m-%d %H:%M} UTC, догоняем пропущенное")
+        await self._load()
+        while True:
+            self._wakeup.clear()
+            timeout = MAX_SLEEP
+            if self._heap:
+                timeout = min(timeout, max(0, (self._heap[0][0] - utc_now()).total_seconds()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self._fire_due()
+            except Exception as e:
+                logger.error(f"Error in reminder scheduler: {e}")
+                self._push(utc_now() + timedelta(seconds=10), "reminder")
+                self._push(utc_now() + timedelta(seconds=10), "schedule")
+                self._push(utc_now() + timedelta(seconds=10), "digest")
+
+    async def _fire_due(self):
+        now = utc_now()
+        started = time.perf_counter()
+        if self._heap and self._heap[0][0] <= now:
+            SCHEDULER_LAG_SECONDS.observe((now - self._heap[0][0]).total_seconds())
+        kinds = set()
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            self._queued.discard(entry)
+            kinds.add(entry[1])
+
+        if not kinds:
+            return
+        try:
+            await self._enqueue(now)
+        finally:
+            SCHEDULER_TICK_SECONDS.observe(time.perf_counter() - started)
+
+    async def _enqueue(self, now):
+        added = await self.db.enqueue_due(now, REMINDER_TEXT, SCHEDULE_TEXT)
+        added += await self._enqueue_digests(now)
+        if added:
+            self.delivery.wake()
+        # Всё наступившее к now уже перенесено, ищем сроки строго после now
+        self._push(await self.db.get_next_reminder_time(after=now), "reminder")
+        self._push(await self.db.get_next_schedule_time(after=now), "schedule")
+        self._push(await self.db.get_next_digest_time(after=now), "digest")
+
+    async def _enqueue_digests(self, now):
+        digests = []
+        for chat_id, fire_at in await self.db.get_due_digests(now):
+            tasks, _, _, reminders, schedule = await self.db.get_list_view(chat_id, cached=False)
+            # Пустой список не присылаем, но срок всё равно переносим
+            text = None
+            if tasks or reminders or schedule:
+                total = await self.db.count_tasks(chat_id) if tasks else 0
+                text = format_tasks_list(tasks, reminders, schedule, title=DIGEST_TITLE.format(total=total))
+            digests.append((chat_id, fire_at, text))
+        if not digests:
+            return 0
+        return await self.db.enqueue_digests(now, digests, parse_mode="Markdown")
+
+class SchedulerLeader:
+    """Запускает планировщик только в том процессе, который держит аренду в базе.
+
+    Аренда продлевается каждые ttl/3 секунд; если процесс завис или упал,
+    через ttl её забирает другой экземпляр. Пока аренда у нас, изменения
+    базы из других процессов подхватываются по PRAGMA data_version, а
+    упавшая задача планировщика перезапускается на следующем продлении.
+    """
+
+    def __init__(self, scheduler, db, ttl=30, name="scheduler"):
+        self.scheduler = scheduler
+        self.db = db
+        self.ttl = ttl
+        self.name = name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def run(self):
+        task = None
+        version = None
+        try:
+            while True:
+                try:
+                    leader = await self.db.acquire_lease(self.name, self.owner, self.ttl)
+                except Exception as e:
+                    logger.error(f"Не удалось продлить аренду планировщика: {e}")
+                    leader = False
+
+                if task is not None and task.done():
+                    # Упавший планировщик нельзя оставлять под живой арендой:
+                    # другие процессы её не заберут, и напоминания встанут
+                    error = None if task.cancelled() else task.exception()
+                    logger.error(f"Планировщик остановился: {error!r}, перезапускаем")
+                    task = None
+
+                if leader and task is None:
+                    logger.info(f"Планировщик запущен в {self.owner}")
+                    task = asyncio.create_task(self.scheduler.run())
+                    version = None
+                elif not leader and task is not None:
+                    logger.warning(f"Аренда планировщика потеряна, {self.owner} останавливает его")
+                    task.cancel()
+                    task = None
+                elif leader:
+                    current = await self.db.data_version()
+                    if version is not None and current != version:
+                        await self.scheduler.reload()
+                    version = current
+
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            if task is not None:
+                task.cancel()
+            await self.db.release_lease(self.name, self.owner)
@@ -1,5 +1,9 @@
+import csv
+import io
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+from recurrence import describe_rule
 
 def parse_time(time_str):
     """Парсит время из строки в формате ЧЧ:ММ или ЧЧ.ММ"""
@@ -22,9 +26,23 @@ def parse_time(time_str):
     except (ValueError, AttributeError):
         return None
 
-def get_time_until_reminder(reminder_time):
-    """Рассчитывает оставшееся время до напоминания"""
-    now = datetime.now()
+def parse_task_lines(text):
+    """Разбивает многострочный текст на задачи, пропуская пустые строки"""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+def parse_tasks_file(filename, content):
+    """Достаёт задачи из .txt (по строке) или .csv (первый столбец)"""
+    try:
+        text = content.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = content.decode('cp1251', errors='replace')
+    if filename.lower().endswith('.csv'):
+        return [row[0].strip() for row in csv.reader(io.StringIO(text)) if row and row[0].strip()]
+    return parse_task_lines(text)
+
+def get_time_until_reminder(reminder_time, tz=None):
+    """Рассчитывает оставшееся время до напоминания по местному времени пользователя"""
+    now = datetime.now(tz).replace(tzinfo=None)
     reminder_hour, reminder_minute = map(int, reminder_time.split(':'))
     
     reminder_today = now.replace(hour=reminder_hour, minute=reminder_minute, second=0, microsecond=0)
@@ -41,32 +59,86 @@ def get_time_until_reminder(reminder_time):
     else:
         return f"{minutes_left}м"
 
-def format_tasks_list(tasks, reminders, schedule=None):
-    text = "📋 **ВАШ СПИСОК ДЕЛ**\n\n"
+MESSAGE_LIMIT = 4096
+LINE_LIMIT = 300
+
+def shorten(text, limit=LINE_LIMIT):
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def escape_markdown(text):
+    """Экранирует пользовательский текст для parse_mode=Markdown (старой разметки)"""
+    return re.sub(r"([_*`\[])", r"\\\1", text)
+
+def fit_lines(lines, limit=MESSAGE_LIMIT):
+    """Склеивает строки один раз, обрезая хвост так, чтобы текст влез в одно сообщение"""
+    size = 0
+    for i, line in enumerate(lines):
+        size += len(line) + 1
+        if size > limit - 40:
+            lines = lines[:i] + [f"… и ещё {len(lines) - i} строк"]
+            break
+    return "\n".join(lines)
+
+def format_tasks_list(tasks, reminders, schedule=None, page=0, paged=False, offset=0, title="📋 **ВАШ СПИСОК ДЕЛ**"):
+    lines = [title, ""]
     
     if tasks:
-        text += "✅ **Задачи:**\n"
-        for i, task in enumerate(tasks, 1):
-            text += f"{i}. {task[1]}\n"
-        text += "\n"
+        title = f"✅ **Задачи** (стр. {page + 1}):" if paged else "✅ **Задачи:**"
+        lines.append(title)
+        for i, task in enumerate(tasks, offset + 1):
+            lines.append(f"{i}. {escape_markdown(shorten(task[1]))}")
+        lines.append("")
 
-    active_reminders = [r for r in reminders if not r[3]]
+    # Отправленные напоминания отфильтрованы ещё в запросе
+    active_reminders = reminders
     if active_reminders:
-        text += "⏰ **Напоминания:**\n"
+        lines.append("⏰ **Напоминания:**")
         for r in active_reminders:
-            text += f"• {r[1]} в {r[2]}\n"
-        text += "\n"
+            repeat = f" ({describe_rule(r[4])})" if len(r) > 4 and r[4] != "once" else ""
+            lines.append(f"• {escape_markdown(shorten(r[1]))} в {r[2]}{repeat}")
+        lines.append("")
 
     if schedule:
-        text += "🗓 **Постоянное расписание:**\n"
+        lines.append("🗓 **Постоянное расписание:**")
         current_day = ""
         for day, time, task_text in schedule:
             if day != current_day:
-                text += f"┈┈ {day.capitalize()} ┈┈\n"
+                lines.append(f"┈┈ {day.capitalize()} ┈┈")
                 current_day = day
-            text += f"└ {time} — {task_text}\n"
+            lines.append(f"└ {time} — {escape_markdown(shorten(task_text))}")
             
     if not tasks and not active_reminders and not schedule:
         return "📭 Ваш список пока пуст!"
         
-    return text
\ No newline at end of file
+    return fit_lines(lines)
+
+def format_history(tasks, reminders, tz=timezone.utc):
+    """Выполненные задачи и отправленные напоминания; время в базе в UTC"""
+    def local(value):
+        if not value:
+            return "—"
+        moment = datetime.fromisoformat(str(value)).replace(tzinfo=timezone.utc).astimezone(tz)
+        return moment.strftime("%d.%m.%Y %H:%M")
+
+    lines = ["📚 **ИСТОРИЯ**", ""]
+    if tasks:
+        lines.append("✅ **Выполненные задачи:**")
+        lines.extend(f"• {escape_markdown(shorten(text))} — {local(done_at)}" for text, done_at in tasks)
+        lines.append("")
+    if reminders:
+        lines.append("⏰ **Отправленные напоминания:**")
+        lines.extend(f"• {escape_markdown(shorten(name))} — {local(sent_at)}" for name, sent_at in reminders)
+    if not tasks and not reminders:
+        return "📭 История пока пуста"
+    return fit_lines(lines)
+
+SEARCH_ICONS = {"task": "📝", "reminder": "⏰", "schedule": "🗓"}
+
+def format_search_results(query, rows, total, page=0, pages=1, offset=0):
+    if not rows:
+        return f"🔍 По запросу «{shorten(query, 100)}» ничего не найдено"
+    title = f"🔍 Найдено: {total}" if pages <= 1 else f"🔍 Найдено: {total} (стр. {page + 1}/{pages})"
+    lines = [title, ""]
+    for i, (kind, _, text) in enumerate(rows, offset + 1):
+        lines.append(f"{i}. {SEARCH_ICONS.get(kind, '•')} {shorten(text or '')}")
+    return fit_lines(lines)
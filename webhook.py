@@ -0,0 +1,51 @@
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+def create_webhook_app(dp, bot, secret_token, path="/webhook"):
+    """aiohttp-приложение, которое сверяет секретный токен, сразу отвечает 200
+    и обрабатывает апдейт в фоновой задаче"""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        handle_in_background=True,
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+def create_forwarding_app(dispatch, secret_token, path="/webhook"):
+    """Приложение для многопроцессного режима: проверяет токен и передаёт
+    сырой апдейт в dispatch (шард-воркеру), не разбирая его"""
+    async def handle(request):
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+            return web.Response(status=401)
+        dispatch(await request.json())
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    return app
+
+async def run_webhook(app, bot, url, secret_token, allowed_updates, host="0.0.0.0", port=8080, path="/webhook"):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    try:
+        # Накопившиеся за время простоя апдейты не сбрасываем
+        await bot.set_webhook(
+            url.rstrip("/") + path,
+            secret_token=secret_token,
+            allowed_updates=allowed_updates,
+            drop_pending_updates=False,
+        )
+        logger.info(f"Вебхук слушает {host}:{port}{path}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+
+from aiogram import Bot, Dispatcher
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+from database import Database
+from fsm_storage import SQLiteStorage
+from handlers import get_handlers_router
+from middlewares import setup_throttling
+from metrics import start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+UPDATE_FIELDS = (
+    "message", "edited_message", "callback_query", "my_chat_member",
+    "chat_member", "chat_join_request", "inline_query",
+)
+
+def chat_id_of(update):
+    """chat_id, по которому шардируется сырой апдейт; 0, если чата нет"""
+    for field in UPDATE_FIELDS:
+        event = update.get(field)
+        if not event:
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = event.get("from")
+        if user:
+            return user["id"]
+    return 0
+
+async def serve_worker(index, token, updates, events, list_cache_ttl):
+    bot = Bot(token=token)
+    db = Database(list_cache_ttl=list_cache_ttl)
+    await db.init_db()
+    # Планировщик живёт в главном процессе: пересылаем ему изменения
+    db.subscribe(lambda event, payload: events.put((event, payload)))
+
+    dp = Dispatcher(storage=SQLiteStorage(db), db=db)
+    dp.include_router(get_handlers_router())
+    setup_throttling(dp)
+
+    # У каждого воркера свои метрики хендлеров и запросов: порт METRICS_PORT + 1 + index
+    metrics_runner = None
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        metrics_runner = await start_metrics_server(os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port) + 1 + index)
+
+    loop = asyncio.get_running_loop()
+    pending = set()
+    logger.info(f"Воркер {index} готов")
+    try:
+        while True:
+            update = await loop.run_in_executor(None, updates.get)
+            if update is None:
+                break
+            task = asyncio.create_task(dp.feed_raw_update(bot, update))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+        await db.close()
+
+def worker_main(index, token, updates, events, list_cache_ttl):
+    asyncio.run(serve_worker(index, token, updates, events, list_cache_ttl))
+
+class WorkerPool:
+    """Процессы-обработчики апдейтов, шардированные по chat_id.
+
+    Все апдейты одного чата попадают в один процесс, поэтому его кэши
+    (FSM, список дел) остаются согласованными. Изменения напоминаний и
+    расписания воркеры возвращают через очередь events.
+    """
+
+    def __init__(self, token, size, list_cache_ttl=30):
+        self.context = multiprocessing.get_context("spawn")
+        self.token = token
+        self.size = size
+        self.list_cache_ttl = list_cache_ttl
+        self.queues = [self.context.Queue() for _ in range(size)]
+        self.events = self.context.Queue()
+        self.processes = [self._spawn(index) for index in range(size)]
+        self.stopping = False
+
+    def _spawn(self, index):
+        return self.context.Process(
+            target=worker_main,
+            args=(index, self.token, self.queues[index], self.events, self.list_cache_ttl),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        logger.info(f"Запущено воркеров: {self.size}")
+
+    def _ensure_alive(self, index):
+        """Перезапускает упавший воркер, иначе его чаты молча остаются без ответа"""
+        process = self.processes[index]
+        if self.stopping or process.is_alive():
+            return
+        logger.error(f"Воркер {index} завершился с кодом {process.exitcode}, перезапускаем")
+        # Процесс мог умереть, держа блокировку своей очереди: берём новую.
+        # Апдейты, которые он не успел забрать, теряются
+        self.queues[index] = self.context.Queue()
+        self.processes[index] = self._spawn(index)
+        self.processes[index].start()
+
+    def dispatch(self, update):
+        index = chat_id_of(update) % self.size
+        self._ensure_alive(index)
+        self.queues[index].put(update)
+
+    async def forward_events(self, callback, check_interval=5):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                item = await loop.run_in_executor(None, self.events.get, True, check_interval)
+            except queue.Empty:
+                # Без апдейтов dispatch не заметит упавший воркер: проверяем здесь
+                for index in range(self.size):
+                    self._ensure_alive(index)
+                continue
+            if item is None:
+                break
+            callback(*item)
+
+    async def stop(self, timeout=10):
+        self.stopping = True
+        for worker_queue in self.queues:
+            worker_queue.put(None)
+        self.events.put(None)
+        # join блокирует: ждём воркеры в пуле потоков, а не в цикле событий
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                process.terminate()
+
+async def poll_updates(bot, dispatch, allowed_updates, timeout=30):
+    """Long polling, который не обрабатывает апдейты сам, а раздаёт их воркерам"""
+    offset = None
+    # Как в Dispatcher._listen_updates: сбой сети не роняет весь бот, а повторяется с паузой до 5 с
+    backoff = Backoff(BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1))
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.error(f"Не удалось получить апдейты: {e}. Повтор через {backoff.next_delay:.1f} с")
+            await backoff.asleep()
+            continue
+        backoff.reset()
+        for update in updates:
+            offset = update.update_id + 1
+            dispatch(update.model_dump(mode="json", by_alias=True, exclude_none=True))